@@ -0,0 +1,371 @@
+"""
+Benchmark the API end to end against local stand-ins for api.weather.gov,
+HERE, Google and OpenAI, which replay the responses recorded in fixtures/ after an
+injected delay, and an in-memory MongoDB (mongomock-motor).
+
+Each phase drives the endpoints at the given concurrency and reports p50 and
+p99 latency, throughput and the upstream calls it made:
+create        POST / with --events events per subscription
+events cold   GET /{subscription_id}/events with empty forecast caches
+events warm   the same again, served from the caches
+event         GET /event/{event_id}
+
+python benchmark.py --subscriptions 200 --concurrency 20 --nws-latency 150
+
+Pass --max-p99 to exit with an error when any phase is slower, for example
+in CI before a deploy. --mongo uses the database in .env instead and writes
+to it.
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import pathlib
+import random
+import sys
+import time
+import httpx
+from dotenv import dotenv_values
+from openai import AsyncOpenAI
+import main
+import tools.forecast_utilities as forecast_utilities
+import tools.http_utilities as http_utilities
+import tools.place_utilities as place_utilities
+from database.core import DB
+
+config = dotenv_values(".env")
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+
+NWS_HOST = "api.weather.gov"
+HERE_HOST = "geocode.search.hereapi.com"
+GOOGLE_HOST = "maps.googleapis.com"
+OPENAI_HOST = "api.openai.com"
+
+
+class MemoryDB(DB):
+
+    def __init__(self):
+        from mongomock_motor import AsyncMongoMockClient
+
+        self.client = AsyncMongoMockClient()
+        self.database = self.client[config.get("DB_NAME") or "benchmark"]
+
+
+class StubUpstreams:
+
+    def __init__(self, latency: dict, jitter: float, seed: int):
+        """
+        Answer requests to api.weather.gov, HERE, Google and OpenAI from the recorded
+        fixtures after latency[host] seconds, varied by up to +/- jitter of it.
+
+        Geocoded coordinates are derived from a hash of the address and
+        gridpoints from the coordinates, so every run resolves the same
+        addresses to the same grid cells. Forecast periods are shifted to
+        start at the current hour.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = collections.Counter()
+
+        self.points = json.loads((FIXTURES / "nws_points.json").read_text())
+        self.geocode = json.loads((FIXTURES / "here_geocode.json").read_text())
+        self.completion = json.loads(
+            (FIXTURES / "openai_chat_completion.json").read_text()
+        )
+        self.hourly = json.loads((FIXTURES / "nws_hourly.json").read_text())
+        periods = self.hourly["properties"]["periods"]
+        recorded = datetime.datetime.fromisoformat(periods[0]["startTime"])
+        now = datetime.datetime.now(recorded.tzinfo)
+        shift = now.replace(minute=0, second=0, microsecond=0) - recorded
+        for period in periods:
+            for field in ["startTime", "endTime"]:
+                start_time = datetime.datetime.fromisoformat(period[field]) + shift
+                period[field] = start_time.isoformat()
+        self.hourly["properties"]["generatedAt"] = now.isoformat()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.calls[host] += 1
+        delay = self.latency.get(host, 0)
+        await asyncio.sleep(
+            delay * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        )
+
+        path = request.url.path
+        if host == NWS_HOST and path.startswith("/points/"):
+            lat, lon = (float(part) for part in path.split("/")[-1].split(","))
+            body = json.loads(json.dumps(self.points))
+            body["properties"]["gridX"] = int((lon + 86) * 20)
+            body["properties"]["gridY"] = int((lat - 38) * 20)
+            return httpx.Response(200, json=body)
+        if host == NWS_HOST and path.endswith("/forecast/hourly"):
+            return httpx.Response(200, json=self.hourly)
+        if host == HERE_HOST:
+            body = json.loads(json.dumps(self.geocode))
+            body["items"][0]["position"] = self.position(request.url.params["q"])
+            return httpx.Response(200, json=body)
+        if host == GOOGLE_HOST:
+            position = self.position(request.url.params["address"])
+            return httpx.Response(
+                200,
+                json={
+                    "status": "OK",
+                    "results": [{"geometry": {"location": position}}],
+                },
+            )
+        if host == OPENAI_HOST:
+            return httpx.Response(200, json=self.complete(json.loads(request.content)))
+        return httpx.Response(404)
+
+    def position(self, address: str) -> dict:
+        digest = hashlib.sha256(address.encode()).digest()
+        return {
+            "lat": round(38 + digest[0] / 255 * 0.5, 5),
+            "lng": round(-86 + digest[1] / 255 * 0.5, 5),
+        }
+
+    def complete(self, body: dict) -> dict:
+        """
+        The recorded completion, or for batched summaries a summarize_forecasts
+        call giving it as the summary of every event in the request.
+        """
+        if "tools" not in body:
+            return self.completion
+        summary = self.completion["choices"][0]["message"]["content"]
+        event_ids = [
+            json.loads(line)["event_id"]
+            for line in body["messages"][-1]["content"].split("\n")
+        ]
+        completion = json.loads(json.dumps(self.completion))
+        completion["choices"][0]["finish_reason"] = "tool_calls"
+        completion["choices"][0]["message"] = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": "call_benchmark",
+                    "type": "function",
+                    "function": {
+                        "name": "summarize_forecasts",
+                        "arguments": json.dumps(
+                            {
+                                "summaries": [
+                                    {"event_id": event_id, "summary": summary}
+                                    for event_id in event_ids
+                                ]
+                            }
+                        ),
+                    },
+                }
+            ],
+        }
+        return completion
+
+
+def use_stub_upstreams(stub: StubUpstreams):
+    transport = httpx.MockTransport(stub.handle)
+    http_utilities._client = httpx.AsyncClient(
+        transport=transport, headers=http_utilities.HTTP_HEADERS
+    )
+    forecast_utilities._openai_client = AsyncOpenAI(
+        api_key="benchmark",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+    place_utilities.config.setdefault("HERE_API_KEY", "benchmark")
+    place_utilities.config.setdefault("GOOGLE_API_KEY", "benchmark")
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def run_phase(name: str, requests: list, concurrency: int, stub) -> dict:
+    """
+    Run the request coroutine functions with at most concurrency in flight.
+    Each returns an httpx.Response; exceptions and statuses of 400 and up
+    count as errors.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    calls_before = collections.Counter(stub.calls)
+
+    async def run(request):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                r = await request()
+            except Exception:
+                r = None
+            latencies.append(time.perf_counter() - start)
+            if r is None or r.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run(request) for request in requests])
+    elapsed = time.perf_counter() - start
+    return {
+        "phase": name,
+        "requests": len(requests),
+        "errors": errors,
+        "throughput": len(requests) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "upstream_calls": dict(stub.calls - calls_before),
+    }
+
+
+def make_event(venues: int, rng: random.Random) -> dict:
+    """
+    A two hour event at one of venues addresses within the NWS forecast range.
+    """
+    start = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        hours=rng.randint(1, 150)
+    )
+    return {
+        "time": {
+            "startDateTime": start.isoformat(),
+            "endDateTime": (start + datetime.timedelta(hours=2)).isoformat(),
+        },
+        "place": {
+            "address": f"{100 + rng.randrange(venues)} W Main St, Louisville, KY 40202"
+        },
+    }
+
+
+def make_subscription(i: int, events: int, venues: int, rng: random.Random) -> dict:
+    return {
+        "subscriber": {"phone": f"555-{i // 10000:03d}-{i % 10000:04d}"},
+        "events": [make_event(venues, rng) for _ in range(events)],
+    }
+
+
+async def benchmark(args) -> list:
+    stub = StubUpstreams(
+        {
+            NWS_HOST: args.nws_latency / 1000,
+            HERE_HOST: args.here_latency / 1000,
+            GOOGLE_HOST: args.google_latency / 1000,
+            OPENAI_HOST: args.openai_latency / 1000,
+        },
+        args.jitter,
+        args.seed,
+    )
+    if not args.mongo:
+        main.DB = MemoryDB
+    main.config["RUN_FORECAST_SCHEDULER"] = "false"
+    rng = random.Random(args.seed)
+
+    results = []
+    async with main.lifespan(main.app):
+        use_stub_upstreams(stub)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://benchmark",
+            timeout=None,
+        ) as client:
+            subscriptions = [
+                make_subscription(i, args.events, args.venues, rng)
+                for i in range(args.subscriptions)
+            ]
+            created = []
+
+            async def create(subscription):
+                r = await client.post("/", json=subscription)
+                if r.status_code < 400:
+                    created.append(r.json())
+                return r
+
+            results.append(
+                await run_phase(
+                    "create",
+                    [lambda s=s: create(s) for s in subscriptions],
+                    args.concurrency,
+                    stub,
+                )
+            )
+
+            for name in ["events cold", "events warm"]:
+                results.append(
+                    await run_phase(
+                        name,
+                        [
+                            lambda s=s: client.get(f"/{s['subscription_id']}/events")
+                            for s in created
+                        ],
+                        args.concurrency,
+                        stub,
+                    )
+                )
+
+            event_ids = [e["event_id"] for s in created for e in s["events"]]
+            results.append(
+                await run_phase(
+                    "event",
+                    [
+                        lambda event_id=event_id: client.get(f"/event/{event_id}")
+                        for event_id in rng.sample(
+                            event_ids, min(len(event_ids), args.subscriptions)
+                        )
+                    ],
+                    args.concurrency,
+                    stub,
+                )
+            )
+    return results
+
+
+def print_results(results: list):
+    print(
+        f"{'phase':<12} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8}  upstream calls"
+    )
+    for result in results:
+        calls = " ".join(
+            f"{host}={count}"
+            for host, count in sorted(result["upstream_calls"].items())
+        )
+        print(
+            f"{result['phase']:<12} {result['requests']:>8} {result['errors']:>6} "
+            f"{result['throughput']:>8.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p99_ms']:>8.1f}  {calls}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subscriptions", type=int, default=100)
+    parser.add_argument("--events", type=int, default=3, help="per subscription")
+    parser.add_argument("--venues", type=int, default=50, help="distinct addresses")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--nws-latency", type=float, default=100, help="ms")
+    parser.add_argument("--here-latency", type=float, default=80, help="ms")
+    parser.add_argument("--google-latency", type=float, default=100, help="ms")
+    parser.add_argument("--openai-latency", type=float, default=800, help="ms")
+    parser.add_argument("--jitter", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo", action="store_true", help="use ATLAS_URI")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    parser.add_argument("--max-p99", type=float, help="fail above this p99, in ms")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(benchmark(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+    if args.max_p99 is not None and any(
+        result["p99_ms"] > args.max_p99 for result in results
+    ):
+        sys.exit(1)
@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+from dotenv import dotenv_values
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .core import DB
+from tools.metrics_utilities import timed
+
+config = dotenv_values(".env")
+
+"""
+    Alerts are recorded in their own collection with the idempotency key as
+    _id, so claiming an alert twice fails on the unique _id. A claim is a
+    lease: an alert left pending longer than ALERT_CLAIM_TIMEOUT, by a run
+    that crashed before recording the outcome, can be claimed again.
+"""
+
+ALERT_CLAIM_TIMEOUT = int(config.get("ALERT_CLAIM_TIMEOUT", 15 * 60))
+
+
+@timed("mongo_claim_alerts")
+async def claim_db_alerts(db: DB, alerts: list) -> list:
+    """
+    Record alerts as pending and return the ones this run claimed. Alerts
+    already recorded by an earlier or concurrent run are skipped, unless
+    their claim has expired.
+    """
+    if not alerts:
+        return []
+    now = datetime.datetime.now(datetime.timezone.utc)
+    documents = [
+        {
+            "_id": alert["key"],
+            "event_id": alert["event_id"],
+            "channel": alert["channel"],
+            "status": "pending",
+            "created_at": now,
+            "claimed_at": now,
+        }
+        for alert in alerts
+    ]
+    skipped = set()
+    try:
+        await db.database.alerts.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        skipped = {error["index"] for error in e.details["writeErrors"]}
+    if skipped:
+        expired = now - datetime.timedelta(seconds=ALERT_CLAIM_TIMEOUT)
+        results = await asyncio.gather(
+            *[
+                db.database.alerts.update_one(
+                    {
+                        "_id": alerts[index]["key"],
+                        "status": "pending",
+                        "$or": [
+                            {"claimed_at": {"$lt": expired}},
+                            # Claimed before claims were leases.
+                            {
+                                "claimed_at": {"$exists": False},
+                                "created_at": {"$lt": expired},
+                            },
+                        ],
+                    },
+                    {"$set": {"claimed_at": now}},
+                )
+                for index in skipped
+            ]
+        )
+        skipped = {
+            index
+            for index, result in zip(skipped, results)
+            if result.modified_count == 0
+        }
+    return [alert for index, alert in enumerate(alerts) if index not in skipped]
+
+
+@timed("mongo_update_alerts")
+async def update_db_alerts(db: DB, sent: list, failed: list):
+    """
+    Mark sent alerts as sent and release failed ones, so a later run can
+    claim and retry them.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if sent:
+        await db.database.alerts.bulk_write(
+            [
+                UpdateOne({"_id": key}, {"$set": {"status": "sent", "sent_at": now}})
+                for key in sent
+            ],
+            ordered=False,
+        )
+    if failed:
+        await db.database.alerts.delete_many({"_id": {"$in": failed}})
@@ -1,10 +1,17 @@
-from typing import Optional
 from dotenv import dotenv_values
-from pymongo import MongoClient
-from contextlib import asynccontextmanager
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
 
 config = dotenv_values(".env")
 
+MONGO_MAX_POOL_SIZE = int(config.get("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(config.get("MONGO_MIN_POOL_SIZE", 0))
+
+# Most documents written by one insert_many or bulk_write call.
+BULK_BATCH_SIZE = int(config.get("BULK_BATCH_SIZE", 1000))
+
 
 class NotFoundError(Exception):
     pass
@@ -13,26 +20,65 @@ class NotFoundError(Exception):
 class DB:
 
     def __init__(self):
-        self.client = MongoClient(config["ATLAS_URI"])
+        """
+        One client, and so one connection pool, for the whole app. Create it
+        in the FastAPI lifespan and reach it from routes through get_db.
+        """
+        self.client = AsyncIOMotorClient(
+            config["ATLAS_URI"],
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+        )
         self.database = self.client[config["DB_NAME"]]
-        self.get_or_create_collection()
 
     def shutdown_db_client(self):
         self.client.close()
         print("Disconnected from the MongoDB database.")
 
-    def get_or_create_collection(self):
-        if self.database.get_collection("subscriptions") == None:
-            self.database.create_collection("subscriptions")
-            self.database.subscriptions.create_index("subscriber.phone", unique=True)
-            self.database.subscriptions.create_index("event.event_id", unique=True)
+    async def get_or_create_collection(self):
+        if "subscriptions" not in await self.database.list_collection_names():
+            await self.database.create_collection("subscriptions")
             print("Database created.")
+        await self.ensure_indexes()
         return self.database.subscriptions
 
-    def __post_init__(self):
-        self.database = self.client[config["DB_NAME"]]
-        self.get_db()
+    async def ensure_indexes(self):
+        """
+        Create the indexes if they are missing. This runs on every startup, so
+        collections created before an index was added get it too.
+        """
+        subscriptions = self.database.subscriptions
+        indexes = await subscriptions.index_information()
+
+        # Events are stored under "events"; this index never matched anything
+        # and made every subscription without events collide on null.
+        if "event.event_id_1" in indexes:
+            await subscriptions.drop_index("event.event_id_1")
+
+        await subscriptions.create_index("subscriber.phone", unique=True)
+        try:
+            await subscriptions.create_index(
+                "events.event_id",
+                unique=True,
+                partialFilterExpression={"events.event_id": {"$exists": True}},
+            )
+        except OperationFailure as e:
+            print(f"Indexing events.event_id without uniqueness: {e}")
+            await subscriptions.create_index("events.event_id")
+        await subscriptions.create_index(
+            [
+                ("events.time.startDateTime", ASCENDING),
+                ("events.place.gridId", ASCENDING),
+            ]
+        )
+        await subscriptions.create_index(
+            [
+                ("events.place.gridId", ASCENDING),
+                ("events.place.gridX", ASCENDING),
+                ("events.place.gridY", ASCENDING),
+            ]
+        )
 
 
-# TODO: add dependency injection to routes and pass a session to the database functions
-# https://pymongo.readthedocs.io/en/stable/api/pymongo/client_session.html
+def get_db(request: Request) -> DB:
+    return request.app.state.db
@@ -1,47 +1,235 @@
-from .core import DB, NotFoundError
+import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .core import BULK_BATCH_SIZE, DB, NotFoundError
 from models import Event
+from tools.metrics_utilities import timed
 
-db = DB()
 
-
-def update_db_event(event_id: str, event: Event):
-    result = db.database.events.update_one
-    (
-        {"event_id": event_id},
-        {"$set": event},
+@timed("mongo_update_event")
+async def update_db_event(db: DB, event_id: str, event: Event):
+    result = await db.database.subscriptions.update_one(
+        {"events.event_id": event_id},
+        {"$set": {"events.$": event}},
     )
+    if result.matched_count == 0:
+        raise NotFoundError(f"Event {event_id} not found")
     return event
 
 
-def add_db_event(subscription_id: str, event: Event):
-    subscription = db.database.subscriptions.find_one({"_id": subscription_id})
-    if subscription is None:
-        raise NotFoundError(f"Subscription {subscription_id} not found")
-    db.database.subscriptions.update_one(
+@timed("mongo_add_event")
+async def add_db_event(db: DB, subscription_id: str, event: Event):
+    result = await db.database.subscriptions.update_one(
         {"_id": subscription_id}, {"$push": {"events": event}}
     )
+    if result.matched_count == 0:
+        raise NotFoundError(f"Subscription {subscription_id} not found")
     return event
 
 
-def delete_db_event(event_id: str):
-    result = db.database.subscriptions.delete_one({"events.event_id": event_id})
-    if result.deleted_count == 0:
+@timed("mongo_add_events")
+async def add_db_events(db: DB, events: list) -> dict:
+    """
+    Add events, given as (subscription_id, event) pairs, with one $push per
+    subscription written in unordered batches. Returns the error message for
+    each event that could not be added, keyed by its index.
+    """
+    errors = {}
+    subscription_ids = list({subscription_id for subscription_id, _ in events})
+    existing = set(
+        await db.database.subscriptions.distinct(
+            "_id", {"_id": {"$in": subscription_ids}}
+        )
+    )
+
+    indexes_by_subscription = {}
+    for index, (subscription_id, _) in enumerate(events):
+        if subscription_id in existing:
+            indexes_by_subscription.setdefault(subscription_id, []).append(index)
+        else:
+            errors[index] = f"Subscription {subscription_id} not found"
+
+    operations = [
+        (
+            indexes,
+            UpdateOne(
+                {"_id": subscription_id},
+                {"$push": {"events": {"$each": [events[i][1] for i in indexes]}}},
+            ),
+        )
+        for subscription_id, indexes in indexes_by_subscription.items()
+    ]
+    for start in range(0, len(operations), BULK_BATCH_SIZE):
+        batch = operations[start : start + BULK_BATCH_SIZE]
+        try:
+            await db.database.subscriptions.bulk_write(
+                [operation for _, operation in batch], ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                for index in batch[error["index"]][0]:
+                    errors[index] = error["errmsg"]
+    return errors
+
+
+@timed("mongo_delete_event")
+async def delete_db_event(db: DB, event_id: str):
+    result = await db.database.subscriptions.update_one(
+        {"events.event_id": event_id},
+        {"$pull": {"events": {"event_id": event_id}}},
+    )
+    if result.modified_count == 0:
         raise NotFoundError(f"Event {event_id} not found")
-    return result.deleted_count
+    return result.modified_count
+
+
+@timed("mongo_update_event_place")
+async def update_db_event_place(db: DB, event_id: str, place: dict):
+    await db.database.subscriptions.update_one(
+        {"events.event_id": event_id}, {"$set": {"events.$.place": place}}
+    )
+    return place
 
 
-def get_db_event(event_id: str):
-    subscription = db.database.subscriptions.find_one({"events.event_id": event_id})
-    event = subscription["events"]
-    if event is None:
+@timed("mongo_get_event")
+async def get_db_event(db: DB, event_id: str):
+    subscription = await db.database.subscriptions.find_one(
+        {"events.event_id": event_id},
+        {"_id": False, "events": {"$elemMatch": {"event_id": event_id}}},
+    )
+    if subscription is None or not subscription.get("events"):
         raise NotFoundError(f"Event {event_id} not found")
-    return event
+    return subscription["events"][0]
 
 
-def get_db_events(
+@timed("mongo_get_events")
+async def get_db_events(
+    db: DB,
     subscription_id: str,
 ):
-    subscription = db.database.subscriptions.find_one({"_id": subscription_id})
+    subscription = await db.database.subscriptions.find_one({"_id": subscription_id})
     if subscription is None:
         raise NotFoundError(f"Subscription {subscription_id} not found")
     return subscription["events"]
+
+
+def start_date_time_range(start: datetime.datetime, end: datetime.datetime) -> dict:
+    """
+    A query on startDateTime for events starting between start and end.
+    startDateTime is stored as an ISO string with its own UTC offset, which
+    only sorts like the time itself to within a day, so the range is widened
+    by a day and callers should check the exact times themselves.
+    """
+    margin = datetime.timedelta(days=1)
+    return {
+        "$gte": (start - margin).isoformat(),
+        "$lte": (end + margin).isoformat(),
+    }
+
+
+async def iter_db_upcoming_events(
+    db: DB, start: datetime.datetime, end: datetime.datetime
+):
+    """
+    Yield the events starting between start and end, by
+    start_date_time_range.
+    """
+    upcoming = {"events.time.startDateTime": start_date_time_range(start, end)}
+    # Matching before the $unwind as well lets the startDateTime index pick
+    # out the subscriptions with upcoming events.
+    cursor = db.database.subscriptions.aggregate(
+        [
+            {"$match": upcoming},
+            {"$unwind": "$events"},
+            {"$match": upcoming},
+            {"$replaceRoot": {"newRoot": "$events"}},
+        ]
+    )
+    async for event in cursor:
+        yield event
+
+
+async def iter_db_grid_events(
+    db: DB,
+    gridId: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    x_range: tuple = (None, None),
+    y_range: tuple = (None, None),
+):
+    """
+    Yield the events in forecast office gridId, within the inclusive
+    (min, max) gridX and gridY ranges, ordered by grid cell. Either end of a
+    range may be None. Events are matched on start and end by
+    start_date_time_range.
+    """
+    place = {"events.place.gridId": gridId}
+    for field, (low, high) in [("gridX", x_range), ("gridY", y_range)]:
+        bounds = {}
+        if low is not None:
+            bounds["$gte"] = low
+        if high is not None:
+            bounds["$lte"] = high
+        if bounds:
+            place[f"events.place.{field}"] = bounds
+    cursor = db.database.subscriptions.aggregate(
+        [
+            {"$match": place},
+            {"$unwind": "$events"},
+            {
+                "$match": {
+                    **place,
+                    "events.time.startDateTime": start_date_time_range(start, end),
+                }
+            },
+            {"$replaceRoot": {"newRoot": "$events"}},
+            {"$sort": {"place.gridX": 1, "place.gridY": 1}},
+        ],
+        # The $sort is blocking; a busy office can exceed its 100 MB limit.
+        allowDiskUse=True,
+    )
+    async for event in cursor:
+        yield event
+
+
+async def iter_db_places(db: DB):
+    """
+    Yield each distinct geocoded address of stored events with its lat and
+    lon.
+    """
+    cursor = db.database.subscriptions.aggregate(
+        [
+            {"$unwind": "$events"},
+            {"$match": {"events.place.lat": {"$ne": None}}},
+            {
+                "$group": {
+                    "_id": "$events.place.address",
+                    "lat": {"$first": "$events.place.lat"},
+                    "lon": {"$first": "$events.place.lon"},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+    )
+    async for place in cursor:
+        yield place["_id"], place["lat"], place["lon"]
+
+
+@timed("mongo_update_event_forecasts")
+async def update_db_event_forecasts(db: DB, forecasts: dict):
+    """
+    Store forecasts, given as a dict of event_id to forecast, on their events.
+    """
+    if not forecasts:
+        return 0
+    result = await db.database.subscriptions.bulk_write(
+        [
+            UpdateOne(
+                {"events.event_id": event_id},
+                {"$set": {"events.$.forecast": forecast}},
+            )
+            for event_id, forecast in forecasts.items()
+        ],
+        ordered=False,
+    )
+    return result.modified_count
@@ -1,49 +1,67 @@
 from bson.objectid import ObjectId
 from .core import DB, NotFoundError
 from models import Subscriber
+from tools.metrics_utilities import timed
 
-db = DB()
 
-
-def create_db_subscriber(subscriber: Subscriber):
+@timed("mongo_create_subscriber")
+async def create_db_subscriber(db: DB, subscriber: Subscriber):
     """
     Create a new subscription with only a subscriber.
     """
     subscription = {}
     subscription["_id"] = str(ObjectId())
     subscription["subscriber"] = subscriber
-    db.database.subscriptions.insert_one(subscription)
+    await db.database.subscriptions.insert_one(subscription)
     return subscription["subscriber"]
 
 
-def get_db_subscriber_by_id(subscription_id: str):
-    subscription = db.database.subscriptions.find_one({"_id": subscription_id})
+@timed("mongo_get_subscriber_by_id")
+async def get_db_subscriber_by_id(db: DB, subscription_id: str):
+    subscription = await db.database.subscriptions.find_one({"_id": subscription_id})
     if subscription is None:
         raise NotFoundError(f"Subscription {subscription_id} not found")
     return subscription["subscriber"]
 
 
-def get_db_subscriber_by_phone(phone: str):
-    subscription = db.database.subscriptions.find_one({"subscriber.phone": phone})
+@timed("mongo_get_subscriber_by_phone")
+async def get_db_subscriber_by_phone(db: DB, phone: str):
+    subscription = await db.database.subscriptions.find_one({"subscriber.phone": phone})
     if subscription is None:
         raise NotFoundError(f"Subscription with phone {phone} not found")
     return subscription["subscriber"]
 
 
-def update_db_subscriber_by_id(subscription_id: str, subscriber: Subscriber):
-    subscription = db.database.subscriptions.find_one({"_id": subscription_id})
-    if subscription is None:
-        raise NotFoundError(f"Subscription {subscription_id} not found")
-    subscription["subscriber"] = subscriber
-    db.database.subscriptions.update_one(
-        {"_id": subscription_id}, {"$set": subscription}
+@timed("mongo_update_subscriber_by_id")
+async def update_db_subscriber_by_id(
+    db: DB, subscription_id: str, subscriber: Subscriber
+):
+    result = await db.database.subscriptions.update_one(
+        {"_id": subscription_id}, {"$set": {"subscriber": subscriber}}
     )
+    if result.matched_count == 0:
+        raise NotFoundError(f"Subscription {subscription_id} not found")
     return subscriber
 
 
-def get_all_db_subscribers():  # FAILED database.core.NotFoundError: Subscription all not found
-    subscriptions = db.database.subscriptions.find(
-        {"subscriber": {"$exists": "true"}}, {"subscriber": "true"}
-    )
+async def iter_db_subscribers(db: DB, after: str = None, limit: int = None):
+    """
+    Yield {"_id", "subscriber"} documents in _id order, starting after the
+    given subscription _id, as the cursor fetches them.
+    """
+    query = {"subscriber": {"$exists": True}}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    cursor = db.database.subscriptions.find(query, {"subscriber": True}).sort("_id", 1)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    async for subscription in cursor:
+        yield subscription
+
 
-    return subscriptions
+@timed("mongo_get_all_subscribers")
+async def get_all_db_subscribers(db: DB, limit: int, after: str = None):
+    return [
+        subscription
+        async for subscription in iter_db_subscribers(db, after=after, limit=limit)
+    ]
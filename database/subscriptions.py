@@ -1,8 +1,10 @@
+import datetime
 from bson.objectid import ObjectId
-from .core import DB, NotFoundError
+from pymongo.errors import BulkWriteError
+from .core import BULK_BATCH_SIZE, DB, NotFoundError
+from .events import start_date_time_range
 from models import Subscription
-
-db = DB()
+from tools.metrics_utilities import timed
 
 
 """
@@ -11,33 +13,93 @@ db = DB()
 """
 
 
-def create_db_subscription(subscription: Subscription):
+@timed("mongo_create_subscription")
+async def create_db_subscription(db: DB, subscription: Subscription):
     subscription["_id"] = str(ObjectId())
-    db.database.subscriptions.insert_one(subscription)
+    await db.database.subscriptions.insert_one(subscription)
     return subscription
 
 
-def get_db_subscription(subscription_id: str):
-    subscription = db.database.subscriptions.find_one({"_id": subscription_id})
+@timed("mongo_insert_subscriptions")
+async def insert_db_subscriptions(db: DB, subscriptions: list) -> dict:
+    """
+    Insert subscriptions in unordered batches. Returns the error message for
+    each subscription that could not be written, keyed by its index.
+    """
+    errors = {}
+    for start in range(0, len(subscriptions), BULK_BATCH_SIZE):
+        batch = subscriptions[start : start + BULK_BATCH_SIZE]
+        for subscription in batch:
+            subscription["_id"] = str(ObjectId())
+        try:
+            await db.database.subscriptions.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                errors[start + error["index"]] = error["errmsg"]
+    return errors
+
+
+@timed("mongo_get_subscription")
+async def get_db_subscription(db: DB, subscription_id: str):
+    subscription = await db.database.subscriptions.find_one({"_id": subscription_id})
     if subscription is None:
         raise NotFoundError(f"Subscription {subscription_id} not found")
     return subscription
 
 
-def get_db_subscription_by_phone(phone: str):
-    subscription = db.database.subscriptions.find_one({"subscriber.phone": phone})
+@timed("mongo_get_subscription_by_phone")
+async def get_db_subscription_by_phone(db: DB, phone: str):
+    subscription = await db.database.subscriptions.find_one({"subscriber.phone": phone})
     if subscription is None:
         raise NotFoundError(f"Subscription with phone {phone} not found")
     return subscription
 
 
-def get_all_db_subscriptions():  # FAILED database.core.NotFoundError: Subscription all not found
-    subscriptions = db.database.subscriptions.find()
-    return subscriptions
+async def iter_db_subscriptions(db: DB, after: str = None, limit: int = None):
+    """
+    Yield subscriptions in _id order, starting after the given _id, as the
+    cursor fetches them.
+    """
+    query = {"_id": {"$gt": after}} if after is not None else {}
+    cursor = db.database.subscriptions.find(query).sort("_id", 1)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    async for subscription in cursor:
+        yield subscription
+
+
+async def iter_db_alert_subscriptions(
+    db: DB, start: datetime.datetime, end: datetime.datetime
+):
+    """
+    Yield subscriptions that want texts or emails and have an event starting
+    between start and end, by start_date_time_range.
+    """
+    cursor = db.database.subscriptions.find(
+        {
+            "events.time.startDateTime": start_date_time_range(start, end),
+            "$or": [
+                {"subscriber.alert_texts": True},
+                {"subscriber.alert_emails": True},
+            ],
+        },
+        {"subscriber": True, "events": True},
+    )
+    async for subscription in cursor:
+        yield subscription
+
+
+@timed("mongo_get_all_subscriptions")
+async def get_all_db_subscriptions(db: DB, limit: int, after: str = None):
+    return [
+        subscription
+        async for subscription in iter_db_subscriptions(db, after=after, limit=limit)
+    ]
 
 
-def delete_db_subscription(subscription_id: str):
-    result = db.database.subscriptions.delete_one({"_id": subscription_id})
+@timed("mongo_delete_subscription")
+async def delete_db_subscription(db: DB, subscription_id: str):
+    result = await db.database.subscriptions.delete_one({"_id": subscription_id})
     if result.deleted_count == 0:
         raise NotFoundError(f"Subscription {subscription_id} not found")
     return result.deleted_count
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import BulkWriteError
+from database.alerts import claim_db_alerts, update_db_alerts
+
+
+def mock_alert(key):
+    return {"key": key, "event_id": f"event-{key}", "channel": "text"}
+
+
+class TestAlerts(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_db = MagicMock()
+        self.alerts = self.mock_db.database.alerts
+        self.alerts.insert_many = AsyncMock()
+        self.alerts.update_one = AsyncMock()
+        self.alerts.bulk_write = AsyncMock()
+        self.alerts.delete_many = AsyncMock()
+
+    async def test_claim_db_alerts(self):
+        alerts = [mock_alert("a"), mock_alert("b")]
+        result = await claim_db_alerts(self.mock_db, alerts)
+        self.assertEqual(result, alerts)
+        documents = self.alerts.insert_many.await_args.args[0]
+        self.assertEqual([document["_id"] for document in documents], ["a", "b"])
+        self.assertTrue(all(document["claimed_at"] for document in documents))
+        self.alerts.update_one.assert_not_awaited()
+
+    async def test_claim_db_alerts_skips_duplicate_keys(self):
+        self.alerts.insert_many.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000}]}
+        )
+        self.alerts.update_one.return_value = MagicMock(modified_count=0)
+        alerts = [mock_alert("a"), mock_alert("b"), mock_alert("c")]
+        result = await claim_db_alerts(self.mock_db, alerts)
+        self.assertEqual(result, [alerts[0], alerts[2]])
+        query = self.alerts.update_one.await_args.args[0]
+        self.assertEqual(query["_id"], "b")
+        self.assertEqual(query["status"], "pending")
+
+    async def test_claim_db_alerts_reclaims_expired_claims(self):
+        self.alerts.insert_many.side_effect = BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 11000}]}
+        )
+        self.alerts.update_one.return_value = MagicMock(modified_count=1)
+        alerts = [mock_alert("a")]
+        result = await claim_db_alerts(self.mock_db, alerts)
+        self.assertEqual(result, alerts)
+
+    async def test_claim_db_alerts_empty(self):
+        self.assertEqual(await claim_db_alerts(self.mock_db, []), [])
+        self.alerts.insert_many.assert_not_awaited()
+
+    async def test_update_db_alerts(self):
+        await update_db_alerts(self.mock_db, ["a"], ["b"])
+        operations = self.alerts.bulk_write.await_args.args[0]
+        self.assertEqual(
+            [operation._filter for operation in operations], [{"_id": "a"}]
+        )
+        self.alerts.delete_many.assert_awaited_once_with({"_id": {"$in": ["b"]}})
+
+
+if __name__ == "__main__":
+    unittest.main()
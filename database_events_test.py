@@ -1,49 +1,165 @@
+import datetime
 import unittest
-from unittest.mock import MagicMock, patch
-from models import Event
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import BulkWriteError
+from database.core import NotFoundError
 from database.events import (
     update_db_event,
     add_db_event,
+    add_db_events,
     delete_db_event,
     get_db_event,
     get_db_events,
-    get_all_db_events,
+    iter_db_grid_events,
+    start_date_time_range,
 )
-from models import Event
 
 
-class TestEvents(unittest.TestCase):
-    @patch("database.events.DB")
-    def test_update_db_event(self, mock_db):
-        mock_event = Event(
-            event_id="123",
+def mock_event(event_id="123"):
+    return {
+        "event_id": event_id,
+        "time": {"startDateTime": "2024-03-01T12:00:00-05:00"},
+        "place": {"address": "123 Main St, Louisville, KY 40202"},
+    }
+
+
+class TestEvents(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_db = MagicMock()
+        self.subscriptions = self.mock_db.database.subscriptions
+        self.subscriptions.update_one = AsyncMock()
+        self.subscriptions.delete_one = AsyncMock()
+        self.subscriptions.find_one = AsyncMock()
+
+    async def test_update_db_event(self):
+        event = mock_event()
+        self.subscriptions.update_one.return_value = MagicMock(matched_count=1)
+        result = await update_db_event(self.mock_db, "123", event)
+        self.assertEqual(result, event)
+        self.subscriptions.update_one.assert_awaited_once_with(
+            {"events.event_id": "123"}, {"$set": {"events.$": event}}
         )
-        mock_db.database.events.update_one.return_value = mock_event
-        result = update_db_event("123", mock_event)
-        self.assertEqual(result, mock_event)
-
-    @patch("database.events.DB")
-    def test_add_db_event(self, mock_db):
-        mock_event = Event(event_id="123", name="Test Event")
-        mock_db.database.subscriptions.find_one.return_value = {
-            "_id": "123",
-            "events": [],
-        }
-        result = add_db_event("123", mock_event)
-        self.assertEqual(result, mock_event)
-
-    @patch("database.events.DB")
-    def test_delete_db_event(self, mock_db):
-        mock_db.database.events.delete_one.return_value = MagicMock(deleted_count=1)
-        result = delete_db_event("123")
+
+    async def test_add_db_event(self):
+        event = mock_event()
+        self.subscriptions.update_one.return_value = MagicMock(matched_count=1)
+        result = await add_db_event(self.mock_db, "123", event)
+        self.assertEqual(result, event)
+
+    async def test_add_db_event_missing_subscription(self):
+        self.subscriptions.update_one.return_value = MagicMock(matched_count=0)
+        with self.assertRaises(NotFoundError):
+            await add_db_event(self.mock_db, "123", mock_event())
+
+    async def test_delete_db_event(self):
+        self.subscriptions.update_one.return_value = MagicMock(modified_count=1)
+        result = await delete_db_event(self.mock_db, "123")
         self.assertEqual(result, 1)
+        self.subscriptions.update_one.assert_awaited_once_with(
+            {"events.event_id": "123"}, {"$pull": {"events": {"event_id": "123"}}}
+        )
+
+    async def test_get_db_event(self):
+        event = mock_event()
+        self.subscriptions.find_one.return_value = {"events": [event]}
+        result = await get_db_event(self.mock_db, "123")
+        self.assertEqual(result, event)
+        self.subscriptions.find_one.assert_awaited_once_with(
+            {"events.event_id": "123"},
+            {"_id": False, "events": {"$elemMatch": {"event_id": "123"}}},
+        )
+
+    async def test_get_db_event_not_found(self):
+        self.subscriptions.find_one.return_value = None
+        with self.assertRaises(NotFoundError):
+            await get_db_event(self.mock_db, "123")
+
+    async def test_get_db_events(self):
+        event = mock_event()
+        self.subscriptions.find_one.return_value = {"_id": "123", "events": [event]}
+        result = await get_db_events(self.mock_db, "123")
+        self.assertEqual(result, [event])
 
-    @patch("database.events.DB")
-    def test_get_db_event(self, mock_db):
-        mock_event = Event(event_id="123", name="Test Event")
-        mock_db.database.events.find_one.return_value = mock_event
-        result = get_db_event("123")
-        self.assertEqual(result, mock_event)
+    async def test_iter_db_grid_events(self):
+        event = mock_event()
+
+        async def cursor():
+            yield event
+
+        self.subscriptions.aggregate = MagicMock(return_value=cursor())
+        now = datetime.datetime.now(datetime.timezone.utc)
+        events = [
+            e
+            async for e in iter_db_grid_events(
+                self.mock_db, "LMK", now, now, (80, None)
+            )
+        ]
+        self.assertEqual(events, [event])
+        pipeline = self.subscriptions.aggregate.call_args.args[0]
+        self.assertTrue(self.subscriptions.aggregate.call_args.kwargs["allowDiskUse"])
+        self.assertEqual(
+            pipeline[0],
+            {
+                "$match": {
+                    "events.place.gridId": "LMK",
+                    "events.place.gridX": {"$gte": 80},
+                }
+            },
+        )
+
+    async def test_add_db_events(self):
+        self.subscriptions.distinct = AsyncMock(return_value=["a", "b"])
+        self.subscriptions.bulk_write = AsyncMock()
+        events = [
+            ("a", mock_event("1")),
+            ("b", mock_event("2")),
+            ("a", mock_event("3")),
+        ]
+        errors = await add_db_events(self.mock_db, events)
+        self.assertEqual(errors, {})
+        operations = self.subscriptions.bulk_write.await_args.args[0]
+        self.assertEqual(
+            [operation._doc for operation in operations],
+            [
+                {"$push": {"events": {"$each": [events[0][1], events[2][1]]}}},
+                {"$push": {"events": {"$each": [events[1][1]]}}},
+            ],
+        )
+
+    async def test_add_db_events_missing_subscription(self):
+        self.subscriptions.distinct = AsyncMock(return_value=["a"])
+        self.subscriptions.bulk_write = AsyncMock()
+        events = [("a", mock_event("1")), ("missing", mock_event("2"))]
+        errors = await add_db_events(self.mock_db, events)
+        self.assertEqual(errors, {1: "Subscription missing not found"})
+        self.assertEqual(len(self.subscriptions.bulk_write.await_args.args[0]), 1)
+
+    async def test_add_db_events_write_errors(self):
+        # A failed $push fails every event pushed to that subscription.
+        self.subscriptions.distinct = AsyncMock(return_value=["a", "b", "c"])
+        self.subscriptions.bulk_write = AsyncMock(
+            side_effect=[
+                None,
+                BulkWriteError({"writeErrors": [{"index": 0, "errmsg": "too big"}]}),
+            ]
+        )
+        events = [
+            ("a", mock_event("1")),
+            ("b", mock_event("2")),
+            ("c", mock_event("3")),
+            ("c", mock_event("4")),
+        ]
+        with patch("database.events.BULK_BATCH_SIZE", 2):
+            errors = await add_db_events(self.mock_db, events)
+        self.assertEqual(errors, {2: "too big", 3: "too big"})
+
+    def test_start_date_time_range(self):
+        start = datetime.datetime(2024, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        end = start + datetime.timedelta(days=7)
+        self.assertEqual(
+            start_date_time_range(start, end),
+            {"$gte": "2024-02-29T12:00:00+00:00", "$lte": "2024-03-09T12:00:00+00:00"},
+        )
 
 
 if __name__ == "__main__":
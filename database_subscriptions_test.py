@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import BulkWriteError
+from database.subscriptions import insert_db_subscriptions
+
+
+def mock_subscription(phone="555-555-5555"):
+    return {"subscriber": {"phone": phone}, "events": []}
+
+
+class TestSubscriptions(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.mock_db = MagicMock()
+        self.subscriptions = self.mock_db.database.subscriptions
+        self.subscriptions.insert_many = AsyncMock()
+
+    async def test_insert_db_subscriptions(self):
+        subscriptions = [mock_subscription(), mock_subscription()]
+        errors = await insert_db_subscriptions(self.mock_db, subscriptions)
+        self.assertEqual(errors, {})
+        self.assertEqual(len({s["_id"] for s in subscriptions}), 2)
+        self.subscriptions.insert_many.assert_awaited_once_with(
+            subscriptions, ordered=False
+        )
+
+    async def test_insert_db_subscriptions_write_errors(self):
+        # Write error indexes are within a batch, and are reported by the
+        # subscription's index in the whole list.
+        self.subscriptions.insert_many.side_effect = [
+            BulkWriteError({"writeErrors": [{"index": 0, "errmsg": "first"}]}),
+            BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "fourth"}]}),
+        ]
+        subscriptions = [mock_subscription() for _ in range(4)]
+        with patch("database.subscriptions.BULK_BATCH_SIZE", 2):
+            errors = await insert_db_subscriptions(self.mock_db, subscriptions)
+        self.assertEqual(errors, {0: "first", 3: "fourth"})
+        self.assertEqual(self.subscriptions.insert_many.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
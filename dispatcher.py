@@ -0,0 +1,126 @@
+"""
+Send text and email alerts for upcoming events whose forecast is new or has
+changed since the event was last alerted.
+
+Run it on a schedule, for example from cron:
+python dispatcher.py
+"""
+
+import asyncio
+import datetime
+from dotenv import dotenv_values
+from database.core import DB
+from database.alerts import claim_db_alerts, update_db_alerts
+from database.subscriptions import iter_db_alert_subscriptions
+from models import _parse_date_time
+from tools.alert_utilities import get_alert_key, get_transports
+from tools.metrics_utilities import configure_logging, logger
+
+config = dotenv_values(".env")
+
+# Alerts claimed and sent together; bounds memory however many are due.
+ALERT_BATCH_SIZE = int(config.get("ALERT_BATCH_SIZE", 500))
+ALERT_DAYS = 7
+
+
+def get_alerts(subscription: dict, channels, now: datetime.datetime) -> list:
+    subscriber = subscription["subscriber"]
+    recipients = {}
+    if subscriber.get("alert_texts") and subscriber.get("phone"):
+        recipients["text"] = subscriber["phone"]
+    if subscriber.get("alert_emails") and subscriber.get("email"):
+        recipients["email"] = subscriber["email"]
+
+    alerts = []
+    for event in subscription.get("events", []):
+        forecast = event.get("forecast") or {}
+        if not forecast.get("summary_key") or not forecast.get("chatgpt_summary"):
+            continue
+        try:
+            start = _parse_date_time(event["time"]["startDateTime"])
+        except (KeyError, TypeError, ValueError, OverflowError) as e:
+            # Skip the event rather than stop every other alert in the run.
+            logger.warning(
+                "Event %s has a bad start time: %r", event.get("event_id"), e
+            )
+            continue
+        if not now < start <= now + datetime.timedelta(days=ALERT_DAYS):
+            continue
+        for channel, to in recipients.items():
+            if channel not in channels:
+                continue
+            alerts.append(
+                {
+                    "key": get_alert_key(event["event_id"], channel, forecast),
+                    "event_id": event["event_id"],
+                    "channel": channel,
+                    "to": to,
+                    "subject": f"Forecast for {event['place']['address']}",
+                    "body": forecast["chatgpt_summary"]["content"],
+                }
+            )
+    return alerts
+
+
+async def send_alerts(db: DB, transports: dict, alerts: list) -> tuple[int, int]:
+    """
+    Claim the alerts, send the claimed ones in one batch per channel, and
+    record which were sent. Returns the number sent and failed.
+    """
+    claimed = await claim_db_alerts(db, alerts)
+    by_channel = {}
+    for alert in claimed:
+        by_channel.setdefault(alert["channel"], []).append(alert)
+
+    results = await asyncio.gather(
+        *[
+            transports[channel].send_batch(batch)
+            for channel, batch in by_channel.items()
+        ]
+    )
+    sent, failed = [], []
+    for batch, errors in zip(by_channel.values(), results):
+        for alert, error in zip(batch, errors):
+            if error is None:
+                sent.append(alert["key"])
+            else:
+                logger.warning("Alert %s failed: %r", alert["key"], error)
+                failed.append(alert["key"])
+    await update_db_alerts(db, sent, failed)
+    return len(sent), len(failed)
+
+
+async def dispatch_alerts(db: DB, transports: dict) -> dict:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    counts = {"sent": 0, "failed": 0}
+    pending = []
+
+    async def flush():
+        sent, failed = await send_alerts(db, transports, pending)
+        counts["sent"] += sent
+        counts["failed"] += failed
+        pending.clear()
+
+    async for subscription in iter_db_alert_subscriptions(
+        db, now, now + datetime.timedelta(days=ALERT_DAYS)
+    ):
+        pending.extend(get_alerts(subscription, transports, now))
+        if len(pending) >= ALERT_BATCH_SIZE:
+            await flush()
+    if pending:
+        await flush()
+    return counts
+
+
+async def main():
+    db = DB()
+    try:
+        counts = await dispatch_alerts(db, get_transports())
+        logger.info("Sent %d alerts, %d failed.", counts["sent"], counts["failed"])
+    finally:
+        db.shutdown_db_client()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
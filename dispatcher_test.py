@@ -0,0 +1,114 @@
+import datetime
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from dispatcher import get_alerts, send_alerts
+
+NOW = datetime.datetime(2024, 3, 1, 12, tzinfo=datetime.timezone.utc)
+
+
+def mock_event(event_id, start):
+    return {
+        "event_id": event_id,
+        "time": {"startDateTime": start},
+        "place": {"address": "123 Main St, Louisville, KY 40202"},
+        "forecast": {
+            "summary_key": "key",
+            "chatgpt_summary": {"content": "Rain likely."},
+        },
+    }
+
+
+def mock_subscription(events, **subscriber):
+    return {
+        "subscriber": {
+            "phone": "5025550100",
+            "email": "someone@example.com",
+            "alert_texts": True,
+            "alert_emails": True,
+            **subscriber,
+        },
+        "events": events,
+    }
+
+
+class TestGetAlerts(unittest.IsolatedAsyncioTestCase):
+    def test_get_alerts_channels(self):
+        subscription = mock_subscription([mock_event("1", "2024-03-02T12:00:00Z")])
+        alerts = get_alerts(subscription, {"text": None, "email": None}, NOW)
+        self.assertEqual(
+            {alert["channel"]: alert["to"] for alert in alerts},
+            {"text": "5025550100", "email": "someone@example.com"},
+        )
+        alerts = get_alerts(subscription, {"email": None}, NOW)
+        self.assertEqual([alert["channel"] for alert in alerts], ["email"])
+
+    def test_get_alerts_subscriber_opted_out(self):
+        subscription = mock_subscription(
+            [mock_event("1", "2024-03-02T12:00:00Z")], alert_texts=False
+        )
+        alerts = get_alerts(subscription, {"text": None, "email": None}, NOW)
+        self.assertEqual([alert["channel"] for alert in alerts], ["email"])
+
+    def test_get_alerts_time_window(self):
+        subscription = mock_subscription(
+            [
+                mock_event("past", "2024-03-01T11:00:00Z"),
+                mock_event("soon", "2024-03-08T12:00:00Z"),
+                mock_event("later", "2024-03-08T12:00:01Z"),
+            ]
+        )
+        alerts = get_alerts(subscription, {"text": None}, NOW)
+        self.assertEqual([alert["event_id"] for alert in alerts], ["soon"])
+
+    def test_get_alerts_bad_start_times(self):
+        missing = mock_event("missing", None)
+        del missing["time"]["startDateTime"]
+        subscription = mock_subscription(
+            [
+                missing,
+                mock_event("garbled", "not a time"),
+                mock_event("good", "2024-03-02T12:00:00Z"),
+            ]
+        )
+        with self.assertLogs("raincheck", "WARNING") as logs:
+            alerts = get_alerts(subscription, {"text": None}, NOW)
+        self.assertEqual([alert["event_id"] for alert in alerts], ["good"])
+        self.assertEqual(len(logs.records), 2)
+
+
+class TestSendAlerts(unittest.IsolatedAsyncioTestCase):
+    async def test_send_alerts_releases_failed_alerts(self):
+        alerts = [
+            {"key": "a", "channel": "text"},
+            {"key": "b", "channel": "text"},
+            {"key": "c", "channel": "email"},
+        ]
+        transports = {"text": MagicMock(), "email": MagicMock()}
+        transports["text"].send_batch = AsyncMock(
+            return_value=[None, RuntimeError("down")]
+        )
+        transports["email"].send_batch = AsyncMock(return_value=[None])
+        db = MagicMock()
+        with patch("dispatcher.claim_db_alerts", AsyncMock(return_value=alerts)), patch(
+            "dispatcher.update_db_alerts", AsyncMock()
+        ) as update:
+            result = await send_alerts(db, transports, alerts)
+        self.assertEqual(result, (2, 1))
+        update.assert_awaited_once_with(db, ["a", "c"], ["b"])
+
+    async def test_send_alerts_skips_unclaimed_alerts(self):
+        alerts = [{"key": "a", "channel": "text"}]
+        transports = {"text": MagicMock()}
+        transports["text"].send_batch = AsyncMock()
+        db = MagicMock()
+        with patch("dispatcher.claim_db_alerts", AsyncMock(return_value=[])), patch(
+            "dispatcher.update_db_alerts", AsyncMock()
+        ) as update:
+            result = await send_alerts(db, transports, alerts)
+        self.assertEqual(result, (0, 0))
+        transports["text"].send_batch.assert_not_awaited()
+        update.assert_awaited_once_with(db, [], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Export the geocoded addresses of stored events to the CSV of known venues
+that GEOCODE_VENUES_PATH in .env points to, so they are geocoded without
+calling HERE after the next restart:
+python geocode_index.py [path]
+
+ZIP code centroids, for GEOCODE_ZIPS_PATH, come from elsewhere, such as the
+Census Bureau's ZCTA gazetteer file, as a CSV with zip, lat and lon columns.
+"""
+
+import asyncio
+import csv
+import sys
+from dotenv import dotenv_values
+from database.core import DB
+from database.events import iter_db_places
+from tools.place_utilities import normalize_address
+
+config = dotenv_values(".env")
+
+
+async def export_venues(db: DB, path: str) -> int:
+    venues = {}
+    async for address, lat, lon in iter_db_places(db):
+        venues.setdefault(normalize_address(address), (lat, lon))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["address", "lat", "lon"])
+        for address, (lat, lon) in sorted(venues.items()):
+            writer.writerow([address, lat, lon])
+    return len(venues)
+
+
+async def main(path: str):
+    db = DB()
+    try:
+        exported = await export_venues(db, path)
+        print(f"Exported {exported} venues to {path}.")
+    finally:
+        db.shutdown_db_client()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else config.get("GEOCODE_VENUES_PATH")
+    if not path:
+        sys.exit("Pass a path or set GEOCODE_VENUES_PATH in .env.")
+    asyncio.run(main(path))
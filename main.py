@@ -1,13 +1,91 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import dotenv_values
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
+from database.core import DB, NotFoundError
+from routers.bulk import router as bulk
 from routers.events import router as events
 from routers.subscribers import router as subscribers
 from routers.subscriptions import router as subscriptions
+from scheduler import run_scheduler
+from tools.http_utilities import close_http_client
+from tools.metrics_utilities import (
+    configure_logging,
+    generate_metrics,
+    logger,
+    new_trace_id,
+)
+from tools.place_utilities import AddressNotFoundError, save_grid_index
+from tools.resilience_utilities import UPSTREAM_EXCEPTIONS
+
+config = dotenv_values(".env")
 
 # TODO: Authentication https://fastapi.tiangolo.com/tutorial/security/first-steps/
 
-# TODO: Logger https://docs.python.org/3/howto/logging-cookbook.html
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db = DB()
+    await app.state.db.get_or_create_collection()
+    scheduler = None
+    if config.get("RUN_FORECAST_SCHEDULER", "").lower() == "true":
+        scheduler = asyncio.create_task(run_scheduler(app.state.db))
+    yield
+    if scheduler is not None:
+        scheduler.cancel()
+    await close_http_client()
+    save_grid_index()
+    app.state.db.shutdown_db_client()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+
+@app.middleware("http")
+async def add_trace_id(request: Request, call_next):
+    """
+    Tag the request with the caller's X-Request-ID, or a new one, so its
+    logs and latency exemplars can be found, and echo it on the response.
+    """
+    trace_id = new_trace_id(request.headers.get("X-Request-ID"))
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = trace_id
+    return response
+
+
+@app.exception_handler(NotFoundError)
+async def not_found(request: Request, e: NotFoundError):
+    return ORJSONResponse(status_code=404, content={"detail": str(e)})
+
+
+@app.exception_handler(AddressNotFoundError)
+async def address_not_found(request: Request, e: AddressNotFoundError):
+    return ORJSONResponse(status_code=422, content={"detail": str(e)})
+
+
+async def upstream_unavailable(request: Request, e: Exception):
+    # Upstream errors can carry request URLs with API keys, so only log them.
+    logger.warning("Upstream unavailable: %r", e)
+    return ORJSONResponse(
+        status_code=503, content={"detail": "An upstream service is unavailable."}
+    )
+
+
+for exception in UPSTREAM_EXCEPTIONS:
+    app.add_exception_handler(exception, upstream_unavailable)
+
+
+# Declared before the routers so /{subscription_id} does not match it.
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    content, media_type = generate_metrics(request.headers.get("Accept", ""))
+    return Response(content=content, headers={"Content-Type": media_type})
+
 
-app = FastAPI()
 app.include_router(subscriptions)
 app.include_router(subscribers)
 app.include_router(events)
+app.include_router(bulk)
@@ -1,12 +1,14 @@
+import asyncio
 from typing import Optional, List
-from pydantic import BaseModel, Field, EmailStr, model_validator
+from pydantic import BaseModel, Field, EmailStr, PrivateAttr, model_validator
 import dateutil.parser
 from dotenv import dotenv_values
 import datetime
 from bson.objectid import ObjectId
 from tools.place_utilities import (
-    _get_lat_lon_for_address_here,
+    _get_lat_lon_for_address,
     _get_gridpoints_by_lat_lon,
+    normalize_address,
 )
 
 config = dotenv_values(".env")
@@ -36,35 +38,21 @@ config = dotenv_values(".env")
                     "gridY": 86
                 },
                 "forecast": {
-                    "raw": {
-                        "number": 1,
-                        "name": "This is the forecast of an event.",
-                        "startTime": "2024-03-01T12:00:00-05:00",
-                        "endTime": "2024-03-01T13:00:00-05:00",
-                        "isDaytime": True,
-                        "temperature": 60,
-                        "temperatureUnit": "F",
-                        "windSpeed": "5 mph",
-                        "windDirection": "SW",
-                        "icon": "https://api.weather.gov/icons/land/day/sct?size=small",
-                        "shortForecast": "Sunny",
-                        "detailedForecast": "This is the detailed forecast of an event."
-                    },
                     "raw_filtered": {
-                        "number": 1,
-                        "name": "This is the forecast of an event.",
-                        "startTime": "2024-03-01T12:00:00-05:00",
-                        "endTime": "2024-03-01T13:00:00-05:00",
-                        "isDaytime": True,
-                        "temperature": 60,
                         "temperatureUnit": "F",
-                        "windSpeed": "5 mph",
-                        "windDirection": "SW",
-                        "icon": "https://api.weather.gov/icons/land/day/sct?size=small",
-                        "shortForecast": "Sunny",
-                        "detailedForecast": "This is the detailed forecast of an event."
+                        "start": [1709312400],
+                        "end": [1709316000],
+                        "utcOffset": [-18000],
+                        "temperature": [60],
+                        "probabilityOfPrecipitation": [20],
+                        "windSpeed": [5],
+                        "windDirection": ["SW"],
+                        "shortForecast": ["Sunny"]
                     },
-                    "chatgpt_chatgpt_summary": {
+                    "expiresAt": 1709316000.0,
+                    "fingerprint": [[1709312400, 60, 20, 5, "Sunny"]],
+                    "summary_key": "9f2c0e...",
+                    "chatgpt_summary": {
                         "content": "Expect showers and thunderstorms for your event with a high of 66°F and 83% chance of rain. Winds from the south at 10 mph. Stay dry and prepare for wet conditions!",
                         "role": "assistant",
                         "function_call": null,
@@ -87,35 +75,21 @@ config = dotenv_values(".env")
                     "gridY": 86
                 },
                 "forecast": {
-                    "raw": {
-                        "number": 1,
-                        "name": "This is the forecast of an event.",
-                        "startTime": "2024-03-01T12:00:00-05:00",
-                        "endTime": "2024-03-01T13:00:00-05:00",
-                        "isDaytime": True,
-                        "temperature": 60,
-                        "temperatureUnit": "F",
-                        "windSpeed": "5 mph",
-                        "windDirection": "SW",
-                        "icon": "https://api.weather.gov/icons/land/day/sct?size=small",
-                        "shortForecast": "Sunny",
-                        "detailedForecast": "This is the detailed forecast of an event."
-                    },
                     "raw_filtered": {
-                        "number": 1,
-                        "name": "This is the forecast of an event.",
-                        "startTime": "2024-03-01T12:00:00-05:00",
-                        "endTime": "2024-03-01T13:00:00-05:00",
-                        "isDaytime": True,
-                        "temperature": 60,
                         "temperatureUnit": "F",
-                        "windSpeed": "5 mph",
-                        "windDirection": "SW",
-                        "icon": "https://api.weather.gov/icons/land/day/sct?size=small",
-                        "shortForecast": "Sunny",
-                        "detailedForecast": "This is the detailed forecast of an event."
+                        "start": [1709312400],
+                        "end": [1709316000],
+                        "utcOffset": [-18000],
+                        "temperature": [60],
+                        "probabilityOfPrecipitation": [20],
+                        "windSpeed": [5],
+                        "windDirection": ["SW"],
+                        "shortForecast": ["Sunny"]
                     },
-                    "chatgpt_chatgpt_summary": {
+                    "expiresAt": 1709316000.0,
+                    "fingerprint": [[1709312400, 60, 20, 5, "Sunny"]],
+                    "summary_key": "9f2c0e...",
+                    "chatgpt_summary": {
                         "content": "Expect showers and thunderstorms for your event with a high of 66°F and 83% chance of rain. Winds from the south at 10 mph. Stay dry and prepare for wet conditions!",
                         "role": "assistant",
                         "function_call": null,
@@ -165,42 +139,87 @@ class Subscriber(BaseModel):
         }
 
 
+EST = datetime.timezone(datetime.timedelta(hours=-5), "EST")
+
+
+def _days_from_now(days: int) -> str:
+    return (datetime.datetime.now(EST) + datetime.timedelta(days=days)).isoformat()
+
+
+def _parse_date_time(date_time: str) -> datetime.datetime:
+    """
+    Parse an ISO datetime, falling back to dateutil for other formats, and
+    treat times without a UTC offset as EST.
+    """
+    try:
+        parsed = datetime.datetime.fromisoformat(date_time)
+    except ValueError:
+        parsed = dateutil.parser.parse(date_time)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=EST)
+    return parsed
+
+
 class Time(BaseModel):
     startDateTime: str = Field(
-        default=datetime.datetime.now(
-            datetime.timezone(datetime.timedelta(hours=-5), "EST")
-        )
-        + datetime.timedelta(days=1),
+        default_factory=lambda: _days_from_now(1),
         metadata=dict(title="This is the startDateTime of an event."),
     )
     endDateTime: Optional[str] = Field(
-        default=datetime.datetime.now(
-            datetime.timezone(datetime.timedelta(hours=-5), "EST")
-        )
-        + datetime.timedelta(days=2),
+        default=None,
         metadata=dict(
             title="This is the endDateTime of an event.",
             description="This is not required.",
         ),
     )
+    _start: Optional[tuple] = PrivateAttr(default=None)
+    _end: Optional[tuple] = PrivateAttr(default=None)
 
     class Config:
         populate_by_name = True
         json_schema_extra = {"example": {"startDateTime": "2024-03-01T12:00:00-05:00"}}
 
+    @property
+    def start(self) -> datetime.datetime:
+        """
+        startDateTime as an aware datetime, parsed once and cached for as
+        long as startDateTime is unchanged.
+        """
+        if self._start is None or self._start[0] != self.startDateTime:
+            self._start = (self.startDateTime, _parse_date_time(self.startDateTime))
+        return self._start[1]
+
+    @property
+    def end(self) -> Optional[datetime.datetime]:
+        if not self.endDateTime:
+            return None
+        if self._end is None or self._end[0] != self.endDateTime:
+            self._end = (self.endDateTime, _parse_date_time(self.endDateTime))
+        return self._end[1]
+
+    @model_validator(mode="after")
+    def normalize_date_times(self):
+        """
+        Store the times as ISO strings with a UTC offset, as parsed, so
+        everything reading them back can use fromisoformat.
+        """
+        start, end = self.start, self.end
+        self.startDateTime = start.isoformat()
+        self._start = (self.startDateTime, start)
+        if end is not None:
+            self.endDateTime = end.isoformat()
+            self._end = (self.endDateTime, end)
+        return self
+
     @model_validator(mode="after")
     def validate_start_end_times(self):
-        if self.endDateTime and dateutil.parser.parse(
-            self.startDateTime
-        ) >= dateutil.parser.parse(self.endDateTime):
+        if self.end is not None and self.start >= self.end:
             raise ValueError("The startDateTime must be before the endDateTime.")
         return self
 
     @model_validator(mode="after")
     def validate_future_start_time(self):
-        if dateutil.parser.parse(self.startDateTime) <= datetime.datetime.now(
-            datetime.timezone(datetime.timedelta(-1, 68400), "EST")
-        ):
+        if self.start <= datetime.datetime.now(EST):
             raise ValueError("The startDateTime must be in the future.")
         return self
 
@@ -252,29 +271,83 @@ class Place(BaseModel):
             "example": {"address": "123 Main St, Louisville, KY 40202"}
         }
 
-    def get_lat_lon_for_address(self):
-        self.lat, self.lon = _get_lat_lon_for_address_here(self.address)
+    async def get_lat_lon_for_address(self):
+        self.lat, self.lon = await _get_lat_lon_for_address(self.address)
 
-    def get_gridpoints_by_lat_lon(self):
-        self.gridId, self.gridX, self.gridY = _get_gridpoints_by_lat_lon(
+    async def get_gridpoints_by_lat_lon(self):
+        self.gridId, self.gridX, self.gridY = await _get_gridpoints_by_lat_lon(
             self.lat, self.lon
         )
 
-    def model_post_init(self, *args, **kwargs):
-        self.get_lat_lon_for_address()
-        self.get_gridpoints_by_lat_lon()
+    @property
+    def resolved(self) -> bool:
+        return None not in (self.lat, self.lon, self.gridId, self.gridX, self.gridY)
+
+    async def resolve(self):
+        """
+        Fill in whatever of lat/lon and the NWS gridpoints is missing.
+
+        This runs once, when a Place is written; the results are stored with
+        the event, so a Place read back from the database is already resolved
+        and makes no calls.
+        """
+        if self.lat is None or self.lon is None:
+            await self.get_lat_lon_for_address()
+        if None in (self.gridId, self.gridX, self.gridY):
+            await self.get_gridpoints_by_lat_lon()
+
+
+async def resolve_places(places: list[Place]) -> list[Optional[Exception]]:
+    """
+    Resolve many places together: each distinct address is geocoded once and
+    each distinct coordinate is looked up once, all concurrently. Returns, for
+    each place, the exception that stopped it resolving or None.
+    """
+    errors = {}
+
+    by_address = {}
+    for place in places:
+        if place.lat is None or place.lon is None:
+            by_address.setdefault(normalize_address(place.address), []).append(place)
+    results = await asyncio.gather(
+        *[_get_lat_lon_for_address(group[0].address) for group in by_address.values()],
+        return_exceptions=True,
+    )
+    for group, result in zip(by_address.values(), results):
+        for place in group:
+            if isinstance(result, Exception):
+                errors[id(place)] = result
+            else:
+                place.lat, place.lon = result
+
+    by_point = {}
+    for place in places:
+        if id(place) not in errors and None in (place.gridId, place.gridX, place.gridY):
+            point = (round(place.lat, 4), round(place.lon, 4))
+            by_point.setdefault(point, []).append(place)
+    results = await asyncio.gather(
+        *[_get_gridpoints_by_lat_lon(*point) for point in by_point],
+        return_exceptions=True,
+    )
+    for group, result in zip(by_point.values(), results):
+        for place in group:
+            if isinstance(result, Exception):
+                errors[id(place)] = result
+            else:
+                place.gridId, place.gridX, place.gridY = result
+
+    return [errors.get(id(place)) for place in places]
 
 
 class Event(BaseModel):
     time: Time
     place: Place
     event_id: str = Field(
-        default=str(ObjectId()),
+        default_factory=lambda: str(ObjectId()),
         metadata=dict(title="This is the event_id of an event."),
     )
-    forecast: Optional[object] = Field(
-        default=None, metadata=dict(title="This is the forecast of an event.")
-    )
+    # No forecast field: forecasts are only written by the scheduler, and one
+    # sent by a client is dropped with the other unknown fields.
 
     class Config:
         populate_by_name = True
@@ -309,3 +382,73 @@ class Subscription(BaseModel):
                 ],
             }
         }
+
+
+class SubscriptionEvent(BaseModel):
+    subscription_id: str
+    event: Event
+
+    class Config:
+        populate_by_name = True
+        json_schema_extra = {
+            "example": {
+                "subscription_id": "65dfa4bf6053318daf2d53f9",
+                "event": {
+                    "time": {
+                        "startDateTime": "2024-03-07T12:00:00-05:00",
+                        "endDateTime": "2024-03-08T13:00:00-05:00",
+                    },
+                    "place": {"address": "123 Main St, Louisville, KY 40202"},
+                },
+            }
+        }
+
+
+"""
+    Read models for documents coming back from our own database. They were
+    validated by the models above when written, so responses skip the
+    validators (future start time, email) and only shape the output.
+"""
+
+
+class SubscriberRead(BaseModel):
+    phone: str
+    email: Optional[str] = None
+    alert_texts: Optional[bool] = None
+    alert_emails: Optional[bool] = None
+
+
+class SubscriberListRead(SubscriberRead):
+    """
+    A subscriber as listed by /subscriber/all, with the _id of its
+    subscription to pass as after when resuming the list.
+    """
+
+    subscription_id: str = Field(validation_alias="_id")
+
+
+class TimeRead(BaseModel):
+    startDateTime: str
+    endDateTime: Optional[str] = None
+
+
+class PlaceRead(BaseModel):
+    address: str
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    gridId: Optional[str] = None
+    gridX: Optional[int] = None
+    gridY: Optional[int] = None
+
+
+class EventRead(BaseModel):
+    event_id: str
+    time: TimeRead
+    place: PlaceRead
+    forecast: Optional[dict] = None
+
+
+class SubscriptionRead(BaseModel):
+    subscription_id: Optional[str] = Field(default=None, validation_alias="_id")
+    subscriber: SubscriberRead
+    events: list[EventRead] = []
@@ -0,0 +1,108 @@
+import datetime
+import unittest
+from pydantic import ValidationError
+from models import Event, SubscriberListRead, SubscriptionRead, Time
+
+
+class TestTime(unittest.TestCase):
+    def test_defaults_are_per_instance(self):
+        time = Time()
+        self.assertIsInstance(time.startDateTime, str)
+        self.assertGreater(time.start, datetime.datetime.now(datetime.timezone.utc))
+        self.assertIsNone(time.end)
+
+    def test_start_without_end_far_out(self):
+        start = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            days=3
+        )
+        time = Time(startDateTime=start.isoformat())
+        self.assertIsNone(time.endDateTime)
+
+    def test_parsed_times_are_cached_and_aware(self):
+        time = Time(
+            startDateTime="2099-03-01T12:00:00", endDateTime="2099-03-01T13:00:00-05:00"
+        )
+        self.assertIs(time.start, time.start)
+        self.assertEqual(time.start, time.end - datetime.timedelta(hours=1))
+
+    def test_times_are_stored_normalized(self):
+        time = Time(
+            startDateTime="2099-03-01T12:00:00", endDateTime="Mar 1 2099 1:00 PM"
+        )
+        self.assertEqual(time.startDateTime, "2099-03-01T12:00:00-05:00")
+        self.assertEqual(time.endDateTime, "2099-03-01T13:00:00-05:00")
+
+    def test_start_must_be_before_end(self):
+        with self.assertRaises(ValidationError):
+            Time(
+                startDateTime="2099-03-01T13:00:00-05:00",
+                endDateTime="2099-03-01T12:00:00-05:00",
+            )
+
+    def test_start_must_be_in_future(self):
+        with self.assertRaises(ValidationError):
+            Time(startDateTime="2000-03-01T12:00:00-05:00", endDateTime=None)
+
+
+class TestEvent(unittest.TestCase):
+    def test_event_ids_are_unique(self):
+        events = [
+            Event(time=Time(), place={"address": "Louisville, KY"}) for _ in range(2)
+        ]
+        self.assertNotEqual(events[0].event_id, events[1].event_id)
+
+    def test_client_forecast_is_dropped(self):
+        event = Event.model_validate(
+            {
+                "time": {"startDateTime": "2099-03-01T12:00:00-05:00"},
+                "place": {"address": "Louisville, KY"},
+                "forecast": {"expiresAt": 1e12, "chatgpt_summary": {"content": "x"}},
+            }
+        )
+        self.assertNotIn("forecast", event.model_dump())
+
+
+class TestSubscriptionRead(unittest.TestCase):
+    def test_past_events_are_read_without_validation(self):
+        subscription = SubscriptionRead.model_validate(
+            {
+                "_id": "abc",
+                "subscriber": {"phone": "555-555-5555", "email": "not-an-email"},
+                "events": [
+                    {
+                        "event_id": "123",
+                        "time": {"startDateTime": "2000-03-01T12:00:00-05:00"},
+                        "place": {"address": "Louisville, KY"},
+                    }
+                ],
+            }
+        )
+        self.assertEqual(subscription.subscription_id, "abc")
+        self.assertEqual(subscription.events[0].event_id, "123")
+
+    def test_internal_fields_are_dropped(self):
+        subscription = SubscriptionRead.model_validate(
+            {
+                "_id": "abc",
+                "subscriber": {"phone": "555-555-5555", "internal": True},
+                "events": [],
+                "internal": True,
+            }
+        )
+        dumped = subscription.model_dump()
+        self.assertEqual(dumped["subscription_id"], "abc")
+        self.assertNotIn("_id", dumped)
+        self.assertNotIn("internal", dumped)
+        self.assertNotIn("internal", dumped["subscriber"])
+
+
+class TestSubscriberListRead(unittest.TestCase):
+    def test_subscription_id(self):
+        subscriber = SubscriberListRead.model_validate(
+            {"_id": "abc", "phone": "555-555-5555"}
+        )
+        self.assertEqual(subscriber.model_dump()["subscription_id"], "abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
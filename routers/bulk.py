@@ -0,0 +1,104 @@
+import json
+from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from database.core import DB, get_db
+from database.events import add_db_events
+from database.subscriptions import insert_db_subscriptions
+from models import Subscription, SubscriptionEvent, resolve_places
+
+router = APIRouter(
+    prefix="",
+    tags=["Bulk"],
+)
+
+
+def _parse_rows(body: bytes, content_type: str) -> tuple[list, dict]:
+    if "ndjson" in content_type:
+        rows, errors = [], {}
+        lines = [line for line in body.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                rows.append((index, json.loads(line)))
+            except json.JSONDecodeError as e:
+                errors[index] = f"Invalid JSON: {e}"
+        return rows, errors
+
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {e}"
+        )
+    if not isinstance(data, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a JSON array or NDJSON rows.",
+        )
+    return list(enumerate(data)), {}
+
+
+@router.post(
+    "/bulk",
+    response_description="Add subscriptions and events in bulk",
+    status_code=status.HTTP_200_OK,
+)
+async def bulk_add(request: Request, db: DB = Depends(get_db)):
+    """
+    Accept a JSON array, or NDJSON with Content-Type application/x-ndjson, of
+    rows. A row is either a subscription, or {"subscription_id", "event"} to
+    add an event to an existing subscription.
+
+    Distinct addresses are geocoded once and concurrently, gridpoints are
+    looked up once per coordinate, and rows are written in unordered batches.
+    A bad row is reported in errors, by its position, without failing the
+    rest of the batch.
+    """
+    rows, errors = _parse_rows(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    received = len(rows) + len(errors)
+
+    subscriptions, events = [], []
+    for index, row in rows:
+        try:
+            if isinstance(row, dict) and "subscription_id" in row:
+                events.append((index, SubscriptionEvent.model_validate(row)))
+            else:
+                subscriptions.append((index, Subscription.model_validate(row)))
+        except (ValidationError, TypeError) as e:
+            errors[index] = str(e)
+
+    places = [
+        (index, event.place)
+        for index, subscription in subscriptions
+        for event in subscription.events
+    ] + [(index, row.event.place) for index, row in events]
+    place_errors = await resolve_places([place for _, place in places])
+    for (index, _), error in zip(places, place_errors):
+        if error is not None:
+            errors.setdefault(index, f"Could not resolve place: {error!r}")
+
+    subscriptions = [(i, row) for i, row in subscriptions if i not in errors]
+    write_errors = await insert_db_subscriptions(
+        db, [jsonable_encoder(subscription) for _, subscription in subscriptions]
+    )
+    for position, error in write_errors.items():
+        errors[subscriptions[position][0]] = error
+
+    events = [(i, row) for i, row in events if i not in errors]
+    write_errors = await add_db_events(
+        db,
+        [(row.subscription_id, jsonable_encoder(row.event)) for _, row in events],
+    )
+    for position, error in write_errors.items():
+        errors[events[position][0]] = error
+
+    return {
+        "rows": received,
+        "subscriptions_added": sum(1 for i, _ in subscriptions if i not in errors),
+        "events_added": sum(1 for i, _ in events if i not in errors),
+        "errors": [
+            {"row": index, "error": error} for index, error in sorted(errors.items())
+        ],
+    }
@@ -1,41 +1,92 @@
-from fastapi import APIRouter, Body, Request, Response, HTTPException, status
-from typing import List
+import asyncio
+import datetime
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Query,
+    Request,
+    Response,
+    HTTPException,
+    status,
+)
+from typing import List, Optional
 from fastapi.encoders import jsonable_encoder
-from models import Event
+from database.core import DB, get_db
+from models import Event, EventRead, Place, _parse_date_time
 from database.events import (
     update_db_event,
+    update_db_event_place,
     add_db_event,
     delete_db_event,
     get_db_event,
     get_db_events,
+    iter_db_grid_events,
 )
-from tools.forecast_utilities import Forecast
+from tools.forecast_utilities import Forecast, forecast_events, iter_filtered_events
+from tools.stream_utilities import ndjson_response
 
 router = APIRouter(
     prefix="",
     tags=["Events"],
 )
 
+# NWS hourly forecasts cover about a week.
+GRID_FORECAST_DAYS = 7
+
+
+async def resolve_stored_places(db: DB, events: list) -> list:
+    """
+    Resolve and store the place of any stored event that is missing its
+    coordinates or gridpoints. Events that are already resolved are left
+    alone without any calls.
+    """
+
+    async def resolve(event):
+        place = Place(**event["place"])
+        if place.resolved:
+            return
+        await place.resolve()
+        event["place"] = jsonable_encoder(place)
+        await update_db_event_place(db, event["event_id"], event["place"])
+
+    await asyncio.gather(*[resolve(event) for event in events])
+    return events
+
 
 @router.put(
     "/event/{event_id}",
     response_description="Update event by ID",
-    response_model=Event,
+    response_model=EventRead,
 )
-def update_event(request: Request, event_id: str, event: Event = Body(...)):
+async def update_event(
+    request: Request,
+    event_id: str,
+    event: Event = Body(...),
+    db: DB = Depends(get_db),
+):
+    await event.place.resolve()
     event = jsonable_encoder(event)
-    updated_event = update_db_event(event_id, event)
+    # The path names the event; keep its ID rather than a new default one.
+    event["event_id"] = event_id
+    updated_event = await update_db_event(db, event_id, event)
     return updated_event
 
 
 @router.post(
     "/{subscription_id}/event/",
     response_description="Add event to subscription",
-    response_model=Event,
+    response_model=EventRead,
 )
-def add_event(request: Request, subscription_id: str, event: Event = Body(...)):
+async def add_event(
+    request: Request,
+    subscription_id: str,
+    event: Event = Body(...),
+    db: DB = Depends(get_db),
+):
+    await event.place.resolve()
     event = jsonable_encoder(event)
-    updated_event = add_db_event(subscription_id, event)
+    updated_event = await add_db_event(db, subscription_id, event)
     return updated_event
 
 
@@ -44,8 +95,8 @@ def add_event(request: Request, subscription_id: str, event: Event = Body(...)):
     response_description="Delete event by ID",
     response_model=int,
 )
-def delete_event(request: Request, event_id: str):
-    deleted_event = delete_db_event(event_id)
+async def delete_event(request: Request, event_id: str, db: DB = Depends(get_db)):
+    deleted_event = await delete_db_event(db, event_id)
     if deleted_event:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     raise HTTPException(
@@ -57,22 +108,60 @@ def delete_event(request: Request, event_id: str):
 @router.get(
     "/event/{event_id}",
     response_description="Get event by ID",
-    response_model=Event,
+    response_model=EventRead,
 )
-def get_event(request: Request, event_id: str):
-    event = get_db_event(event_id)
-    event = Forecast(event)
+async def get_event(request: Request, event_id: str, db: DB = Depends(get_db)):
+    event = await get_db_event(db, event_id)
+    await resolve_stored_places(db, [event])
+    forecast = Forecast(event)
+    await forecast.main_get_forecast()
+    event["forecast"] = forecast.forecast
     return event
 
 
 @router.get(
     "/{subscription_id}/events",
     response_description="Get events by subscription ID",
-    response_model=List[Event],
+    response_model=List[EventRead],
 )
-def get_events(request: Request, subscription_id: str):
-    events = get_db_events(subscription_id)
-    # Bug: Forecast is not being applied to all events
-    for event in events:
-        event = Forecast(event)
-    return events
+async def get_events(request: Request, subscription_id: str, db: DB = Depends(get_db)):
+    events = await get_db_events(db, subscription_id)
+    await resolve_stored_places(db, events)
+    return await forecast_events(events)
+
+
+@router.get(
+    "/grid/{gridId}/events",
+    response_description="Stream forecasts for every event in a forecast office",
+)
+async def get_grid_events(
+    gridId: str,
+    x_min: Optional[int] = Query(default=None, ge=0),
+    x_max: Optional[int] = Query(default=None, ge=0),
+    y_min: Optional[int] = Query(default=None, ge=0),
+    y_max: Optional[int] = Query(default=None, ge=0),
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    db: DB = Depends(get_db),
+):
+    """
+    Stream as NDJSON every event in forecast office gridId, optionally within
+    gridX and gridY ranges, that starts between start and end, by default the
+    coming week. Each grid cell's hourly forecast is fetched once and filtered
+    to each event's window; no summaries are written.
+    """
+    start = start or datetime.datetime.now(datetime.timezone.utc)
+    end = end or start + datetime.timedelta(days=GRID_FORECAST_DAYS)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=datetime.timezone.utc)
+
+    async def events():
+        async for event in iter_db_grid_events(
+            db, gridId, start, end, (x_min, x_max), (y_min, y_max)
+        ):
+            if start <= _parse_date_time(event["time"]["startDateTime"]) <= end:
+                yield event
+
+    return ndjson_response(iter_filtered_events(events()))
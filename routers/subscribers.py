@@ -1,13 +1,30 @@
-from fastapi import APIRouter, Body, Request, Response, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Query,
+    Request,
+    Response,
+    HTTPException,
+    status,
+)
 from fastapi.encoders import jsonable_encoder
-from typing import List
-from models import Subscriber
+from database.core import DB, get_db
+from typing import List, Literal, Optional
+from models import Subscriber, SubscriberListRead, SubscriberRead
 from database.subscribers import (
     create_db_subscriber,
     get_db_subscriber_by_id,
     get_db_subscriber_by_phone,
     update_db_subscriber_by_id,
     get_all_db_subscribers,
+    iter_db_subscribers,
+)
+from tools.stream_utilities import (
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    ndjson_response,
+    set_next_page_link,
 )
 
 router = APIRouter(
@@ -16,54 +33,83 @@ router = APIRouter(
 )
 
 
+def _list_subscriber(subscription: dict) -> SubscriberListRead:
+    return SubscriberListRead.model_validate(
+        {**subscription["subscriber"], "_id": subscription["_id"]}
+    )
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
     response_description="Add new subscriber",
-    response_model=Subscriber,
+    response_model=SubscriberRead,
 )
-def create_subscriber(request: Request, subscriber: Subscriber = Body(...)):
+async def create_subscriber(
+    request: Request, subscriber: Subscriber = Body(...), db: DB = Depends(get_db)
+):
     subscriber = jsonable_encoder(subscriber)
-    created_subscriber = create_db_subscriber(subscriber)
+    created_subscriber = await create_db_subscriber(db, subscriber)
     return created_subscriber
 
 
+@router.get(
+    "/all",
+    response_description="Get all subscribers",
+    response_model=List[SubscriberListRead],
+)
+async def get_all_subscribers(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: DB = Depends(get_db),
+):
+    """
+    Page through subscribers in subscription _id order; the Link header points
+    at the next page. With format=ndjson the subscribers are streamed instead.
+    """
+    if format == "ndjson":
+        subscriptions = iter_db_subscribers(db, after=after, limit=limit)
+        return ndjson_response(
+            _list_subscriber(subscription).model_dump()
+            async for subscription in subscriptions
+        )
+    limit = limit or PAGE_SIZE
+    subscriptions = await get_all_db_subscribers(db, limit=limit, after=after)
+    set_next_page_link(request, response, subscriptions, limit)
+    return [_list_subscriber(subscription) for subscription in subscriptions]
+
+
 @router.get(
     "/{subscription_id}",
     response_description="Get subscriber by ID",
-    response_model=Subscriber,
+    response_model=SubscriberRead,
 )
-def get_subscriber(subscription_id: str):
-    subscriber = get_db_subscriber_by_id(subscription_id)
+async def get_subscriber(subscription_id: str, db: DB = Depends(get_db)):
+    subscriber = await get_db_subscriber_by_id(db, subscription_id)
     return subscriber
 
 
 @router.get(
     "/phone/{phone}",
     response_description="Get subscriber by phone",
-    response_model=Subscriber,
+    response_model=SubscriberRead,
 )
-def get_subscriber_by_phone(phone: str):
-    subscriber = get_db_subscriber_by_phone(phone)
+async def get_subscriber_by_phone(phone: str, db: DB = Depends(get_db)):
+    subscriber = await get_db_subscriber_by_phone(db, phone)
     return subscriber
 
 
 @router.put(
     "/{subscriber_id}",
     response_description="Update subscriber by ID",
-    response_model=Subscriber,
+    response_model=SubscriberRead,
 )
-def update_subscriber(subscriber_id: str, subscriber: Subscriber = Body(...)):
+async def update_subscriber(
+    subscriber_id: str, subscriber: Subscriber = Body(...), db: DB = Depends(get_db)
+):
     subscriber = jsonable_encoder(subscriber)
-    updated_subscriber = update_db_subscriber_by_id(subscriber_id, subscriber)
+    updated_subscriber = await update_db_subscriber_by_id(db, subscriber_id, subscriber)
     return updated_subscriber
-
-
-@router.get(  # FAILED database.core.NotFoundError: Subscription all not found
-    "/all",
-    response_description="Get all subscribers",
-    response_model=List[Subscriber],
-)
-def get_all_subscribers():
-    subscribers = get_all_db_subscribers()
-    return subscribers
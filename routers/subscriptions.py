@@ -1,14 +1,32 @@
-from fastapi import APIRouter, Body, Request, Response, HTTPException, status
+import asyncio
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Query,
+    Request,
+    Response,
+    HTTPException,
+    status,
+)
 from fastapi.encoders import jsonable_encoder
-from typing import List
-from models import Subscription
+from database.core import DB, get_db
+from typing import List, Literal, Optional
+from models import Subscription, SubscriptionRead
 from database.subscriptions import (
     create_db_subscription,
     get_db_subscription,
     get_db_subscription_by_phone,
     get_all_db_subscriptions,
+    iter_db_subscriptions,
     delete_db_subscription,
 )
+from tools.stream_utilities import (
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    ndjson_response,
+    set_next_page_link,
+)
 
 router = APIRouter(
     prefix="",
@@ -20,24 +38,62 @@ router = APIRouter(
     "/",
     response_description="Create a new subscription",
     status_code=status.HTTP_201_CREATED,
-    response_model=Subscription,
+    response_model=SubscriptionRead,
 )
-def create_subscription(request: Request, subscription: Subscription = Body(...)):
+async def create_subscription(
+    request: Request,
+    subscription: Subscription = Body(...),
+    db: DB = Depends(get_db),
+):
 
+    await asyncio.gather(*[event.place.resolve() for event in subscription.events])
     subscription = jsonable_encoder(subscription)
-    created_subscription = create_db_subscription(subscription)
+    created_subscription = await create_db_subscription(db, subscription)
     return created_subscription
 
 
+@router.get(
+    "/all",
+    response_description="List all subscriptions",
+    status_code=status.HTTP_200_OK,
+    response_model=List[SubscriptionRead],
+)
+async def get_all_subscriptions(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: DB = Depends(get_db),
+):
+    """
+    Page through subscriptions in _id order; the Link header points at the
+    next page. With format=ndjson the subscriptions are streamed instead.
+    """
+
+    if format == "ndjson":
+        subscriptions = iter_db_subscriptions(db, after=after, limit=limit)
+        return ndjson_response(
+            SubscriptionRead.model_validate(subscription).model_dump()
+            async for subscription in subscriptions
+        )
+    limit = limit or PAGE_SIZE
+    subscriptions = await get_all_db_subscriptions(db, limit=limit, after=after)
+    set_next_page_link(request, response, subscriptions, limit)
+    return subscriptions
+
+
 @router.get(
     "/{subscription_id}",
     response_description="Get subscription by subscription_id",
     status_code=status.HTTP_200_OK,
-    response_model=Subscription,
+    response_model=SubscriptionRead,
 )
-def get_subscription(request: Request, subscription_id: str):
+async def get_subscription(
+    request: Request, subscription_id: str, db: DB = Depends(get_db)
+):
 
-    if (subscription := get_db_subscription(subscription_id)) is not None:
+    if (subscription := await get_db_subscription(db, subscription_id)) is not None:
         return subscription
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -49,11 +105,13 @@ def get_subscription(request: Request, subscription_id: str):
     "/phone/{phone}",
     response_description="Get subscription by phone number",
     status_code=status.HTTP_200_OK,
-    response_model=Subscription,
+    response_model=SubscriptionRead,
 )
-def get_subscription_by_phone(request: Request, phone: str):
+async def get_subscription_by_phone(
+    request: Request, phone: str, db: DB = Depends(get_db)
+):
 
-    if (subscription := get_db_subscription_by_phone(phone)) is not None:
+    if (subscription := await get_db_subscription_by_phone(db, phone)) is not None:
         return subscription
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -61,26 +119,16 @@ def get_subscription_by_phone(request: Request, phone: str):
     )
 
 
-@router.get(  # FAILED database.core.NotFoundError: Subscription all not found
-    "/all",
-    response_description="List all subscriptions",
-    status_code=status.HTTP_200_OK,
-    response_model=List[Subscription],
-)
-def get_all_subscriptions(request: Request):
-
-    subscriptions = get_all_db_subscriptions()
-    return subscriptions
-
-
 @router.delete(
     "/{subscription_id}",
     response_description="Delete a subscription",
     status_code=status.HTTP_204_NO_CONTENT,
 )
-def delete_subscription(subscription_id: str, request: Request):
+async def delete_subscription(
+    subscription_id: str, request: Request, db: DB = Depends(get_db)
+):
 
-    deleted_subscription = delete_db_subscription(subscription_id)
+    deleted_subscription = await delete_db_subscription(db, subscription_id)
     if deleted_subscription:
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     raise HTTPException(
@@ -0,0 +1,138 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+from fastapi import FastAPI
+from database.core import get_db
+from routers import bulk
+
+
+def mock_event(address="123 Main St, Louisville, KY 40202"):
+    return {
+        "time": {"startDateTime": "2099-03-07T12:00:00-05:00"},
+        "place": {"address": address},
+    }
+
+
+def mock_subscription(address="123 Main St, Louisville, KY 40202"):
+    return {"subscriber": {"phone": "555-555-5555"}, "events": [mock_event(address)]}
+
+
+class TestBulk(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(bulk.router)
+        self.db = MagicMock()
+        app.dependency_overrides[get_db] = lambda: self.db
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        )
+        self.resolve_places = AsyncMock(side_effect=lambda places: [None] * len(places))
+        self.insert_db_subscriptions = AsyncMock(return_value={})
+        self.add_db_events = AsyncMock(return_value={})
+        for name in ["resolve_places", "insert_db_subscriptions", "add_db_events"]:
+            patcher = patch(f"routers.bulk.{name}", getattr(self, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def post_ndjson(self, lines: list):
+        return await self.client.post(
+            "/bulk",
+            content="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    async def test_bulk_add(self):
+        rows = [
+            mock_subscription(),
+            {"subscription_id": "abc", "event": mock_event()},
+        ]
+        response = await self.client.post("/bulk", json=rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"rows": 2, "subscriptions_added": 1, "events_added": 1, "errors": []},
+        )
+        events = self.add_db_events.await_args.args[1]
+        self.assertEqual([subscription_id for subscription_id, _ in events], ["abc"])
+
+    async def test_bulk_add_invalid_json(self):
+        response = await self.client.post(
+            "/bulk", content="[{", headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = await self.client.post("/bulk", json={"subscriber": {}})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_bulk_add_invalid_ndjson_rows(self):
+        response = await self.post_ndjson(
+            [json.dumps(mock_subscription()), "{", json.dumps(mock_subscription())]
+        )
+        result = response.json()
+        self.assertEqual(result["rows"], 3)
+        self.assertEqual(result["subscriptions_added"], 2)
+        self.assertEqual([error["row"] for error in result["errors"]], [1])
+        self.assertIn("Invalid JSON", result["errors"][0]["error"])
+
+    async def test_bulk_add_validation_errors(self):
+        rows = [
+            mock_subscription(),
+            {"subscriber": {"phone": "555-555-5555"}, "events": [{"place": {}}]},
+            ["not", "a", "row"],
+            {"subscription_id": "abc", "event": {"time": {}}},
+        ]
+        response = await self.client.post("/bulk", json=rows)
+        result = response.json()
+        self.assertEqual(result["subscriptions_added"], 1)
+        self.assertEqual(result["events_added"], 0)
+        self.assertEqual([error["row"] for error in result["errors"]], [1, 2, 3])
+        self.assertEqual(len(self.insert_db_subscriptions.await_args.args[1]), 1)
+        self.assertEqual(self.add_db_events.await_args.args[1], [])
+
+    async def test_bulk_add_place_errors(self):
+        self.resolve_places.side_effect = lambda places: [
+            ValueError("Address not found") if place.address == "nowhere" else None
+            for place in places
+        ]
+        rows = [
+            mock_subscription(),
+            mock_subscription("nowhere"),
+            {"subscription_id": "abc", "event": mock_event("nowhere")},
+        ]
+        response = await self.client.post("/bulk", json=rows)
+        result = response.json()
+        self.assertEqual(result["subscriptions_added"], 1)
+        self.assertEqual(result["events_added"], 0)
+        self.assertEqual([error["row"] for error in result["errors"]], [1, 2])
+        self.assertIn("Could not resolve place", result["errors"][0]["error"])
+
+    async def test_bulk_add_write_errors(self):
+        # Write errors are keyed by position among the rows written, which
+        # skips rows that already failed.
+        self.insert_db_subscriptions.return_value = {1: "duplicate key"}
+        self.add_db_events.return_value = {0: "Subscription missing not found"}
+        rows = [
+            mock_subscription(),
+            ["not", "a", "row"],
+            mock_subscription(),
+            {"subscription_id": "missing", "event": mock_event()},
+            {"subscription_id": "abc", "event": mock_event()},
+        ]
+        response = await self.client.post("/bulk", json=rows)
+        result = response.json()
+        self.assertEqual(result["subscriptions_added"], 1)
+        self.assertEqual(result["events_added"], 1)
+        self.assertEqual(
+            result["errors"][1:],
+            [
+                {"row": 2, "error": "duplicate key"},
+                {"row": 3, "error": "Subscription missing not found"},
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Precompute forecasts for upcoming events so the GET endpoints can serve the
+stored forecast instead of calling NWS and OpenAI.
+
+Run in process by setting RUN_FORECAST_SCHEDULER=true in .env, or on its own:
+python scheduler.py
+"""
+
+import asyncio
+import datetime
+from dotenv import dotenv_values
+from database.core import DB
+from database.events import iter_db_upcoming_events, update_db_event_forecasts
+from models import _parse_date_time
+from tools.forecast_utilities import CELL_BATCH_SIZE, Forecast, forecast_events
+from tools.metrics_utilities import configure_logging, logger
+
+config = dotenv_values(".env")
+
+# How often to look for events whose stored forecast has expired. The forecast
+# cache follows the NWS Expires header, so a grid cell is only fetched again
+# once NWS has published a new forecast for it.
+FORECAST_REFRESH_INTERVAL = int(config.get("FORECAST_REFRESH_INTERVAL", 5 * 60))
+FORECAST_DAYS = 7
+
+
+async def _refresh_batch(db: DB, expired: list) -> int:
+    await forecast_events(expired)
+    forecasts = {
+        event["event_id"]: event["forecast"]
+        for event in expired
+        if event["forecast"] is not None and not event["forecast"].get("stale")
+    }
+    await update_db_event_forecasts(db, forecasts)
+    return len(forecasts)
+
+
+async def refresh_forecasts(db: DB, batch_size: int = CELL_BATCH_SIZE) -> int:
+    """
+    Refresh the expired forecasts of events starting within FORECAST_DAYS,
+    batch_size events at a time.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    end = now + datetime.timedelta(days=FORECAST_DAYS)
+    refreshed = 0
+    expired = []
+    async for event in iter_db_upcoming_events(db, now, end):
+        try:
+            start = _parse_date_time(event["time"]["startDateTime"])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+        if not now <= start <= end or event["place"].get("gridId") is None:
+            continue
+        if Forecast(event).fresh():
+            continue
+        expired.append(event)
+        if len(expired) >= batch_size:
+            refreshed += await _refresh_batch(db, expired)
+            expired = []
+    if expired:
+        refreshed += await _refresh_batch(db, expired)
+    return refreshed
+
+
+async def run_scheduler(db: DB):
+    while True:
+        try:
+            refreshed = await refresh_forecasts(db)
+            logger.info("Refreshed %d forecasts.", refreshed)
+        except Exception as e:
+            logger.warning("Forecast refresh failed: %r", e)
+        await asyncio.sleep(FORECAST_REFRESH_INTERVAL)
+
+
+async def main():
+    db = DB()
+    try:
+        await run_scheduler(db)
+    finally:
+        db.shutdown_db_client()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+import abc
+import asyncio
+import hashlib
+import json
+import smtplib
+import time
+from email.message import EmailMessage
+from dotenv import dotenv_values
+from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential
+
+config = dotenv_values(".env")
+
+ALERT_ATTEMPTS = int(config.get("ALERT_ATTEMPTS", 5))
+
+
+def get_alert_key(event_id: str, channel: str, forecast: dict) -> str:
+    """
+    Idempotency key for alerting one event's forecast on one channel. It only
+    changes when the forecast does, so an event is never alerted twice for the
+    same forecast.
+    """
+    content = f"{event_id}:{channel}:{forecast['summary_key']}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class RateLimiter:
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Token bucket allowing rate acquisitions per second on average and up
+        to burst at once.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Transport(abc.ABC):
+
+    channel = None
+
+    def __init__(self, rate: float = 10, burst: int = 10):
+        self.rate_limiter = RateLimiter(rate, burst)
+
+    @abc.abstractmethod
+    async def send(self, message: dict):
+        pass
+
+    async def send_with_retries(self, message: dict):
+        async for attempt in AsyncRetrying(
+            wait=wait_random_exponential(multiplier=1, max=30),
+            stop=stop_after_attempt(ALERT_ATTEMPTS),
+            reraise=True,
+        ):
+            with attempt:
+                await self.rate_limiter.acquire()
+                await self.send(message)
+
+    async def send_batch(self, messages: list) -> list:
+        """
+        Send messages concurrently, paced by the rate limiter and retried with
+        backoff. Returns the exception for each message that failed, or None.
+        """
+        results = await asyncio.gather(
+            *[self.send_with_retries(message) for message in messages],
+            return_exceptions=True,
+        )
+        return [result if isinstance(result, Exception) else None for result in results]
+
+
+class FileTransport(Transport):
+
+    def __init__(self, channel: str, path: str, **kwargs):
+        """
+        Append each message to a file as a JSON line, as a local stand-in for
+        a text or email provider.
+        """
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.path = path
+
+    async def send(self, message: dict):
+        await asyncio.to_thread(self._write, message)
+
+    def _write(self, message: dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(message) + "\n")
+
+
+class SMTPTransport(Transport):
+
+    channel = "email"
+
+    def __init__(self, host: str, port: int, sender: str, **kwargs):
+        """
+        Send emails over SMTP, for example to a local debugging server such as
+        python -m aiosmtpd -n -l localhost:1025.
+        """
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    async def send(self, message: dict):
+        await asyncio.to_thread(self._send, message)
+
+    def _send(self, message: dict):
+        email = EmailMessage()
+        email["From"] = self.sender
+        email["To"] = message["to"]
+        email["Subject"] = message["subject"]
+        email["Message-ID"] = f"<{message['key']}@raincheck>"
+        email.set_content(message["body"])
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            smtp.send_message(email)
+
+
+def get_transports() -> dict:
+    """
+    Transports by channel, chosen with ALERT_TEXT_TRANSPORT and
+    ALERT_EMAIL_TRANSPORT. Only the local file and SMTP transports exist so
+    far; a provider transport plugs in by subclassing Transport.
+    """
+    rate = float(config.get("ALERT_RATE_PER_SECOND", 10))
+    transports = {}
+    if config.get("ALERT_TEXT_TRANSPORT", "file") == "file":
+        transports["text"] = FileTransport(
+            "text", config.get("ALERT_TEXT_FILE", "alerts_text.ndjson"), rate=rate
+        )
+    if config.get("ALERT_EMAIL_TRANSPORT", "file") == "smtp":
+        transports["email"] = SMTPTransport(
+            config.get("SMTP_HOST", "localhost"),
+            int(config.get("SMTP_PORT", 1025)),
+            config.get("ALERT_EMAIL_SENDER", "alerts@raincheck.local"),
+            rate=rate,
+        )
+    elif config.get("ALERT_EMAIL_TRANSPORT", "file") == "file":
+        transports["email"] = FileTransport(
+            "email", config.get("ALERT_EMAIL_FILE", "alerts_email.ndjson"), rate=rate
+        )
+    return transports
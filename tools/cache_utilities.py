@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+import redis.asyncio as redis
+from dotenv import dotenv_values
+from redis.exceptions import RedisError
+from tools.metrics_utilities import CACHE_REQUESTS, STALE_SERVED, logger
+
+config = dotenv_values(".env")
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    Return the shared Redis client when REDIS_URL is configured, otherwise
+    None so the caches stay in process.
+    """
+    global _redis_client
+    if not config.get("REDIS_URL"):
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(config["REDIS_URL"])
+    return _redis_client
+
+
+class TTLCache:
+
+    def __init__(
+        self,
+        namespace: str,
+        redis_client=None,
+        max_entries: int = None,
+        stale_ttl: float = 0,
+    ):
+        """
+        Cache values for a given number of seconds.
+
+        Entries are kept in process (L1) and, when a Redis client is given, in
+        Redis as JSON (L2) so every worker and restart shares them. The L1 is
+        bounded to max_entries, evicting the least recently used entry.
+        Concurrent misses for the same key are coalesced by get_or_fetch so
+        only one caller goes upstream. Hits and misses are counted in stats.
+
+        With stale_ttl, expired entries are kept that many seconds longer for
+        get_stale, to be served when the upstream cannot be reached.
+        """
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.stats = {"hits": 0, "redis_hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def _redis_key(self, key) -> str:
+        if isinstance(key, tuple):
+            key = ":".join(str(part) for part in key)
+        return f"{self.namespace}:{key}"
+
+    def _count(self, stat: str, result: str):
+        self.stats[stat] += 1
+        CACHE_REQUESTS.labels(self.namespace, result).inc()
+
+    def _redis_failed(self, operation: str, e: Exception):
+        # Redis is optional: carry on with the in-process cache alone.
+        logger.warning("Redis %s failed for %s cache: %r", operation, self.namespace, e)
+
+    def _set_entry(self, key, value, ttl: float):
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self._count("hits", "hit")
+                return value
+            if expires_at + self.stale_ttl <= time.time():
+                self._entries.pop(key, None)
+
+        if self.redis_client is not None:
+            redis_key = self._redis_key(key)
+            try:
+                cached = await self.redis_client.get(redis_key)
+                # Redis keeps entries for stale_ttl past their expiry.
+                if cached is not None:
+                    ttl = await self.redis_client.ttl(redis_key) - self.stale_ttl
+            except RedisError as e:
+                self._redis_failed("get", e)
+                cached = None
+            if cached is not None:
+                value = json.loads(cached)
+                self._set_entry(key, value, ttl)
+                if ttl > 0:
+                    self._count("redis_hits", "redis_hit")
+                    return value
+        self._count("misses", "miss")
+        return None
+
+    async def get_stale(self, key):
+        """
+        Return the value for key even if it has expired, as long as it is
+        within stale_ttl of expiring, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] + self.stale_ttl > time.time():
+            value = entry[1]
+        elif self.redis_client is not None:
+            try:
+                cached = await self.redis_client.get(self._redis_key(key))
+            except RedisError as e:
+                self._redis_failed("get", e)
+                cached = None
+            if cached is None:
+                return None
+            value = json.loads(cached)
+        else:
+            return None
+        STALE_SERVED.labels(self.namespace).inc()
+        return value
+
+    async def set(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+        self._set_entry(key, value, ttl)
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.set(
+                    self._redis_key(key),
+                    json.dumps(value),
+                    ex=max(int(ttl + self.stale_ttl), 1),
+                )
+            except RedisError as e:
+                self._redis_failed("set", e)
+
+    async def delete(self, key):
+        self._entries.pop(key, None)
+        if self.redis_client is not None:
+            try:
+                await self.redis_client.delete(self._redis_key(key))
+            except RedisError as e:
+                self._redis_failed("delete", e)
+
+    def begin_fetch(self, key):
+        """
+        Register the caller as fetching key and return None, or return the
+        future of the fetch already in flight for key to await instead. The
+        caller must then call end_fetch, whatever happens.
+        """
+        if key in self._inflight:
+            return self._inflight[key]
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def end_fetch(self, key, value=None, error: BaseException = None):
+        """
+        Hand the fetched value, or the error that stopped the fetch, to the
+        callers waiting on key.
+        """
+        future = self._inflight.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(value)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+        else:
+            future.cancel()
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        Return the cached value for key, awaiting fetch() on a miss.
+
+        fetch must be a coroutine function returning a (value, ttl) tuple.
+        Callers that miss while another caller is already fetching the same
+        key wait for that fetch instead of starting their own, and take it
+        over if that caller is cancelled.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        while (inflight := self.begin_fetch(key)) is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller fetching it was cancelled, not this one, so
+                # fetch it here or wait for whoever took over.
+        try:
+            value, ttl = await fetch()
+            await self.set(key, value, ttl)
+        except BaseException as e:
+            self.end_fetch(key, error=e)
+            raise
+        self.end_fetch(key, value)
+        return value
@@ -1,15 +1,341 @@
-import requests
+import asyncio
+import bisect
+from array import array
+import hashlib
+import json
+import time
+import httpx
 import dateutil.parser
 from dotenv import dotenv_values
-from openai import OpenAI
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI
 import datetime
+from tools.cache_utilities import TTLCache, get_redis_client
+from tools.http_utilities import http_get
+from tools.metrics_utilities import logger, timed
+from tools.resilience_utilities import UPSTREAM_EXCEPTIONS, call_upstream
 
 config = dotenv_values(".env")
 
-openai_client = OpenAI(
-    api_key=config["OPENAI_API_KEY"],
+_openai_client = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=config["OPENAI_API_KEY"],
+            # Retries and deadlines are handled by call_upstream.
+            max_retries=0,
+        )
+    return _openai_client
+
+
+# NWS refreshes the hourly gridpoint forecast roughly once an hour.
+DEFAULT_FORECAST_TTL = 60 * 60
+MIN_FORECAST_TTL = 60
+
+# Upper bound on OpenAI completions in flight for one batch of events.
+SUMMARY_CONCURRENCY = int(config.get("SUMMARY_CONCURRENCY", 5))
+
+# Most events summarized by one completion, and a rough limit on the prompt
+# tokens they may add up to. A batch size of 1 summarizes events one by one.
+SUMMARY_BATCH_SIZE = int(config.get("SUMMARY_BATCH_SIZE", 8))
+SUMMARY_BATCH_TOKENS = int(config.get("SUMMARY_BATCH_TOKENS", 6000))
+# Completion tokens allowed per event; 350 characters is about 90 tokens.
+SUMMARY_TOKENS_PER_EVENT = 120
+
+SUMMARIZE_FORECASTS_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "summarize_forecasts",
+        "description": "Record the weather forecast summary of each event.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "summaries": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "event_id": {"type": "string"},
+                            "summary": {"type": "string"},
+                        },
+                        "required": ["event_id", "summary"],
+                    },
+                }
+            },
+            "required": ["summaries"],
+        },
+    },
+}
+
+FORECAST_CACHE_SIZE = int(config.get("FORECAST_CACHE_SIZE", 2048))
+
+# Events read from a cursor before their grid cells are fetched together.
+CELL_BATCH_SIZE = int(config.get("CELL_BATCH_SIZE", 500))
+
+# How long past its expiry a grid cell's forecast may still be served, marked
+# stale, while api.weather.gov is failing.
+FORECAST_STALE_TTL = int(config.get("FORECAST_STALE_TTL", 6 * 60 * 60))
+
+# Hard limit in seconds on one summary, retries included.
+OPENAI_DEADLINE = float(config.get("OPENAI_DEADLINE", 30))
+
+forecast_cache = TTLCache(
+    "hourly", get_redis_client(), FORECAST_CACHE_SIZE, FORECAST_STALE_TTL
 )
 
+# Summaries are keyed by a hash of the filtered periods and the event window,
+# and expire with the forecast they were written from.
+summary_cache = TTLCache("summary", get_redis_client(), FORECAST_CACHE_SIZE)
+
+# Smallest change in an hourly period that counts as a new forecast, in °F,
+# percentage points and mph. Smaller moves keep the stored summary and alerts.
+FINGERPRINT_THRESHOLDS = {
+    "temperature": float(config.get("FINGERPRINT_TEMPERATURE_THRESHOLD", 3)),
+    "probabilityOfPrecipitation": float(
+        config.get("FINGERPRINT_PRECIPITATION_THRESHOLD", 10)
+    ),
+    "windSpeed": float(config.get("FINGERPRINT_WIND_SPEED_THRESHOLD", 5)),
+}
+
+
+def _get_forecast_ttl(r: httpx.Response) -> float:
+    """
+    Seconds until the NWS forecast in the response should be fetched again,
+    from the Expires header or, failing that, from properties.generatedAt.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    expires_at = None
+    if r.headers.get("Expires"):
+        try:
+            expires_at = parsedate_to_datetime(r.headers["Expires"])
+        except (TypeError, ValueError):
+            expires_at = None
+    if expires_at is None:
+        generated_at = r.json()["properties"].get("generatedAt")
+        if generated_at:
+            expires_at = dateutil.parser.parse(generated_at) + datetime.timedelta(
+                seconds=DEFAULT_FORECAST_TTL
+            )
+    if expires_at is None:
+        return DEFAULT_FORECAST_TTL
+    return max((expires_at - now).total_seconds(), MIN_FORECAST_TTL)
+
+
+@timed("nws_hourly_forecast")
+async def _fetch_hourly_forecast(
+    gridId: str, gridX: int, gridY: int
+) -> tuple[dict, float]:
+    r = await http_get(
+        f"https://api.weather.gov/gridpoints/{gridId}/{gridX},{gridY}/forecast/hourly"
+    )
+    ttl = _get_forecast_ttl(r)
+    hourly = {
+        "columns": compact_periods(r.json()["properties"]["periods"]),
+        "expiresAt": time.time() + ttl,
+    }
+    return hourly, ttl
+
+
+async def _get_hourly_forecast(gridId: str, gridX: int, gridY: int) -> dict:
+    """
+    Hourly forecast columns for a grid cell, and the epoch time they expire,
+    shared by every event in the cell until NWS publishes a new forecast.
+
+    When NWS cannot be reached the last forecast for the cell is returned,
+    with stale set, as long as it expired less than FORECAST_STALE_TTL ago.
+    """
+    try:
+        return await forecast_cache.get_or_fetch(
+            (gridId, gridX, gridY),
+            lambda: _fetch_hourly_forecast(gridId, gridX, gridY),
+        )
+    except UPSTREAM_EXCEPTIONS as e:
+        hourly = await forecast_cache.get_stale((gridId, gridX, gridY))
+        if hourly is None:
+            raise
+        logger.warning(
+            "Serving stale forecast for %s/%s,%s: %r", gridId, gridX, gridY, e
+        )
+        return {**hourly, "stale": True}
+
+
+def _to_epoch(date_time: str) -> float:
+    return datetime.datetime.fromisoformat(date_time).timestamp()
+
+
+def _get_wind_speed(wind_speed: str):
+    """
+    The highest speed in an NWS wind speed such as "5 mph" or "5 to 10 mph".
+    """
+    speeds = [int(word) for word in (wind_speed or "").split() if word.isdigit()]
+    return max(speeds, default=None)
+
+
+# Per-period values kept from NWS hourly periods, in column order. Units,
+# icons, names and detailed forecasts are dropped.
+PERIOD_COLUMNS = [
+    "start",
+    "end",
+    "utcOffset",
+    "temperature",
+    "probabilityOfPrecipitation",
+    "windSpeed",
+    "windDirection",
+    "shortForecast",
+]
+
+
+def compact_periods(periods: list) -> dict:
+    """
+    NWS hourly periods, sorted by start, as one list per column: start and
+    end in epoch seconds, the UTC offset NWS gave in seconds, temperature,
+    precipitation chance, the highest wind speed in mph, and windDirection
+    and shortForecast as indexes into strings, where each distinct string
+    is kept once.
+    """
+    periods = sorted(periods, key=lambda period: _to_epoch(period["startTime"]))
+    strings = {}
+    columns = {column: [] for column in PERIOD_COLUMNS}
+    for period in periods:
+        start = datetime.datetime.fromisoformat(period["startTime"])
+        columns["start"].append(int(start.timestamp()))
+        columns["end"].append(int(_to_epoch(period["endTime"])))
+        columns["utcOffset"].append(int(start.utcoffset().total_seconds()))
+        columns["temperature"].append(period.get("temperature"))
+        columns["probabilityOfPrecipitation"].append(
+            (period.get("probabilityOfPrecipitation") or {}).get("value")
+        )
+        columns["windSpeed"].append(_get_wind_speed(period.get("windSpeed")))
+        for column in ["windDirection", "shortForecast"]:
+            columns[column].append(
+                strings.setdefault(period.get(column) or "", len(strings))
+            )
+    columns["temperatureUnit"] = (
+        periods[0].get("temperatureUnit") if periods else None
+    ) or "F"
+    columns["strings"] = list(strings)
+    return columns
+
+
+class PeriodIndex:
+
+    def __init__(self, columns: dict):
+        """
+        The compact_periods columns of a grid cell, with the start and end
+        times in typed arrays so events can be matched with binary search.
+        """
+        self.columns = columns
+        self.starts = array("d", columns["start"])
+        self.ends = array("d", columns["end"])
+
+    def overlapping(self, start: float, end: float = None) -> dict:
+        """
+        The periods overlapping [start, end), or containing start when there
+        is no end, as columns with the strings filled in. Hourly periods do
+        not overlap, so ends are sorted as well.
+        """
+        first = bisect.bisect_right(self.ends, start)
+        if end is None or end <= start:
+            last = bisect.bisect_right(self.starts, start)
+        else:
+            last = bisect.bisect_left(self.starts, end)
+
+        strings = self.columns["strings"]
+        periods = {"temperatureUnit": self.columns["temperatureUnit"]}
+        for column in PERIOD_COLUMNS:
+            periods[column] = self.columns[column][first:last]
+        for column in ["windDirection", "shortForecast"]:
+            periods[column] = [strings[code] for code in periods[column]]
+        return periods
+
+
+def describe_periods(periods: dict) -> str:
+    """
+    One line per period of overlapping columns for a prompt, for example
+    "Fri Mar 01 12:00 PM -0500: 60°F, 20% precipitation, wind SW 5 mph, Sunny".
+    """
+    unit = periods["temperatureUnit"]
+    lines = []
+    for start, offset, temperature, pop, wind, direction, short in zip(
+        periods["start"],
+        periods["utcOffset"],
+        periods["temperature"],
+        periods["probabilityOfPrecipitation"],
+        periods["windSpeed"],
+        periods["windDirection"],
+        periods["shortForecast"],
+    ):
+        local = datetime.datetime.fromtimestamp(
+            start, datetime.timezone(datetime.timedelta(seconds=offset))
+        )
+        wind = "unknown" if wind is None else f"{direction} {wind} mph".strip()
+        lines.append(
+            f"{local:%a %b %d %I:%M %p %z}: {temperature}°{unit}, {pop or 0}% "
+            f"precipitation, wind {wind}, {short}"
+        )
+    return "\n".join(lines)
+
+
+_period_indexes = {}
+
+
+def _get_period_index(grid_cell: tuple, hourly: dict) -> PeriodIndex:
+    """
+    The PeriodIndex for a grid cell's hourly forecast, built once per fetch and
+    shared by every event in the cell.
+    """
+    expires_at, index = _period_indexes.get(grid_cell, (None, None))
+    if expires_at != hourly["expiresAt"]:
+        index = PeriodIndex(hourly["columns"])
+        _period_indexes.pop(grid_cell, None)
+        _period_indexes[grid_cell] = (hourly["expiresAt"], index)
+        while len(_period_indexes) > FORECAST_CACHE_SIZE:
+            _period_indexes.pop(next(iter(_period_indexes)))
+    return index
+
+
+def fingerprint_forecast(periods: dict) -> list:
+    """
+    The fields of each overlapping period that matter to a summary:
+    [start, temperature, probabilityOfPrecipitation, windSpeed, shortForecast].
+    """
+    return [
+        list(row)
+        for row in zip(
+            periods["start"],
+            periods["temperature"],
+            periods["probabilityOfPrecipitation"],
+            periods["windSpeed"],
+            periods["shortForecast"],
+        )
+    ]
+
+
+def fingerprint_changed(
+    previous: list, current: list, thresholds: dict = FINGERPRINT_THRESHOLDS
+) -> bool:
+    """
+    Whether the forecast moved materially: different periods or short
+    forecasts, or a temperature, precipitation chance or wind speed that moved
+    by at least its threshold.
+    """
+    if len(previous) != len(current):
+        return True
+    fields = ["temperature", "probabilityOfPrecipitation", "windSpeed"]
+    for old, new in zip(previous, current):
+        if old[0] != new[0] or old[4] != new[4]:
+            return True
+        for field, old_value, new_value in zip(fields, old[1:4], new[1:4]):
+            if old_value is None or new_value is None:
+                if old_value != new_value:
+                    return True
+            elif abs(new_value - old_value) >= thresholds[field]:
+                return True
+    return False
+
 
 class Forecast:
 
@@ -35,48 +361,145 @@ class Forecast:
             }
         }
 
+        Call main_get_forecast to fetch, filter and summarize the forecast.
         """
 
+        self.event_id = event.get("event_id")
         self.place = event["place"]
         self.time = event["time"]
-        self.main_get_forecast()
+        self.stored_forecast = event.get("forecast") or {}
+        self.forecast = None
 
-    def get_forecast(self):
-        r = requests.get(
-            f"https://api.weather.gov/gridpoints/{self.place['gridId']}/{self.place['gridX']},{self.place['gridY']}/forecast/hourly"
+    @property
+    def grid_cell(self) -> tuple[str, int, int]:
+        return self.place["gridId"], self.place["gridX"], self.place["gridY"]
+
+    def use_hourly_forecast(self, hourly: dict):
+        self.expires_at = hourly["expiresAt"]
+        self.stale = hourly.get("stale", False)
+        self.period_index = _get_period_index(self.grid_cell, hourly)
+
+    def fresh(self) -> bool:
+        """
+        Whether the forecast stored with the event, for example by the
+        scheduler, is still current and can be served as is. Forecasts stored
+        without a summary, because OpenAI failed, are summarized again.
+        """
+        return (
+            self.stored_forecast.get("expiresAt", 0) > time.time()
+            and self.stored_forecast.get("chatgpt_summary") is not None
         )
-        r.raise_for_status()
-        self.raw = r.json()["properties"]["periods"]
 
+    def use_stored_forecast(self):
+        """
+        Fall back to the forecast stored with the event, marked stale, when
+        a new one could not be fetched.
+        """
+        self.forecast = None
+        if self.stored_forecast:
+            self.forecast = {**self.stored_forecast, "stale": True}
+
+    async def get_forecast(self):
+        self.use_hourly_forecast(await _get_hourly_forecast(*self.grid_cell))
+
+    @timed("filter_forecast")
     def filter_forecast(self) -> dict:
 
         event_start_time = dateutil.parser.parse(self.time["startDateTime"])
-        event_end_time = dateutil.parser.parse(self.time["endDateTime"])
+        event_end_time = None
+        if self.time.get("endDateTime"):
+            event_end_time = dateutil.parser.parse(self.time["endDateTime"])
+            event_end_time = event_end_time.timestamp()
 
-        forecast_periods = []
-        for period_forecast in self.raw:
-            period_start = dateutil.parser.parse(period_forecast["startTime"])
-            period_end = dateutil.parser.parse(period_forecast["endTime"])
-
-            if event_start_time >= period_start and event_end_time <= period_end:
-                forecast_periods.append(period_forecast)
+        forecast_periods = self.period_index.overlapping(
+            event_start_time.timestamp(), event_end_time
+        )
 
         self.forecast = {}
         self.forecast["raw_filtered"] = forecast_periods
+        self.forecast["expiresAt"] = self.expires_at
+        if self.stale:
+            self.forecast["stale"] = True
 
-    def summarize_forecast(self):
-        summary = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            max_tokens=350,
-            messages=[
-                {
-                    "role": "function",
-                    "name": "summarize_forecast",
-                    "content": f"Pay attention to the startTime with respect to current time. Summarize the weather forecast in casual language addressing second person singular under 350 characters: {self.forecast['raw_filtered'], self.time}",
-                }
+    def summary_key(self) -> str:
+        content = json.dumps(
+            [
+                self.forecast["raw_filtered"],
+                self.time["startDateTime"],
+                self.time.get("endDateTime"),
             ],
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @timed("openai_summary")
+    async def create_summary(self) -> dict:
+        summary = await call_upstream(
+            "api.openai.com",
+            lambda: get_openai_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                max_tokens=350,
+                messages=[
+                    {
+                        "role": "function",
+                        "name": "summarize_forecast",
+                        "content": f"Pay attention to the startTime with respect to current time. Summarize the weather forecast in casual language addressing second person singular under 350 characters: {describe_periods(self.forecast['raw_filtered']), self.time}",
+                    }
+                ],
+            ),
+            deadline=OPENAI_DEADLINE,
         )
-        self.forecast["chatgpt_summary"] = summary.choices[0].message
+        return summary.choices[0].message.model_dump()
+
+    def summary_ttl(self) -> float:
+        return max(self.expires_at - time.time(), MIN_FORECAST_TTL)
+
+    def reuse_stored_summary(self) -> bool:
+        """
+        Keep the summary stored with the event, and return True, while the
+        forecast has not changed materially since it was written. Otherwise
+        set the new fingerprint and summary_key and return False.
+        """
+        fingerprint = fingerprint_forecast(self.forecast["raw_filtered"])
+        stored = self.stored_forecast
+        if (
+            stored.get("chatgpt_summary") is not None
+            and stored.get("fingerprint") is not None
+            and not fingerprint_changed(stored["fingerprint"], fingerprint)
+        ):
+            # Keep the stored fingerprint so slow drift is measured from the
+            # forecast that was summarized, and the summary_key so alerts keyed
+            # on it are not sent again.
+            self.forecast["fingerprint"] = stored["fingerprint"]
+            self.forecast["summary_key"] = stored["summary_key"]
+            self.forecast["chatgpt_summary"] = stored["chatgpt_summary"]
+            return True
+
+        self.forecast["fingerprint"] = fingerprint
+        self.forecast["summary_key"] = self.summary_key()
+        return False
+
+    async def summarize_forecast(self):
+        """
+        Keep the stored summary while the forecast has not changed materially.
+        Otherwise reuse a summary cached for identical filtered periods and
+        event window, and only then ask OpenAI. Identical concurrent requests
+        share one completion.
+        """
+        if self.reuse_stored_summary():
+            return
+
+        async def fetch():
+            return await self.create_summary(), self.summary_ttl()
+
+        try:
+            self.forecast["chatgpt_summary"] = await summary_cache.get_or_fetch(
+                self.forecast["summary_key"], fetch
+            )
+        except UPSTREAM_EXCEPTIONS as e:
+            # Serve the forecast without a summary; it is retried next time.
+            logger.warning("Summary unavailable: %r", e)
+            self.forecast["chatgpt_summary"] = None
 
     def forecastable(self):
 
@@ -91,9 +514,289 @@ class Forecast:
             return False
         return True
 
-    def main_get_forecast(self):
+    async def main_get_forecast(self):
 
-        if self.forecastable():
-            self.get_forecast()
+        if self.fresh():
+            self.forecast = self.stored_forecast
+        elif self.forecastable():
+            try:
+                await self.get_forecast()
+            except UPSTREAM_EXCEPTIONS as e:
+                logger.warning("Forecast unavailable: %r", e)
+                self.use_stored_forecast()
+                return
             self.filter_forecast()
-            self.summarize_forecast()
+            await self.summarize_forecast()
+
+
+def _summary_request(forecast: Forecast, summary_id: str) -> str:
+    return json.dumps(
+        {
+            "event_id": summary_id,
+            "time": forecast.time,
+            "periods": describe_periods(forecast.forecast["raw_filtered"]),
+        },
+        default=str,
+    )
+
+
+def batch_by_tokens(
+    items: list,
+    tokens: list,
+    batch_size: int = SUMMARY_BATCH_SIZE,
+    batch_tokens: int = SUMMARY_BATCH_TOKENS,
+) -> list:
+    """
+    Split items, in order, into batches of at most batch_size items whose
+    tokens add up to at most batch_tokens. An item over batch_tokens gets a
+    batch of its own.
+    """
+    batches, batch, total = [], [], 0
+    for item, item_tokens in zip(items, tokens):
+        if batch and (len(batch) >= batch_size or total + item_tokens > batch_tokens):
+            batches.append(batch)
+            batch, total = [], 0
+        batch.append(item)
+        total += item_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+@timed("openai_batch_summary")
+async def create_summaries(requests: dict) -> dict:
+    """
+    Summarize several events in one completion. requests maps each event's
+    summary ID to its _summary_request. Returns the summaries, shaped like
+    Forecast.create_summary messages, by summary ID.
+
+    Raises ValueError when the reply is not a summarize_forecasts call.
+    Events left out of the reply are missing from the result.
+    """
+    completion = await call_upstream(
+        "api.openai.com",
+        lambda: get_openai_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            max_tokens=SUMMARY_TOKENS_PER_EVENT * len(requests),
+            tools=[SUMMARIZE_FORECASTS_TOOL],
+            tool_choice={
+                "type": "function",
+                "function": {"name": "summarize_forecasts"},
+            },
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"The current time is {datetime.datetime.now(datetime.timezone.utc).isoformat()}. Pay attention to each event's startTime with respect to current time. For each event, summarize its weather forecast in casual language addressing second person singular under 350 characters, and call summarize_forecasts with every event_id.",
+                },
+                {"role": "user", "content": "\n".join(requests.values())},
+            ],
+        ),
+        deadline=OPENAI_DEADLINE,
+    )
+    tool_calls = completion.choices[0].message.tool_calls
+    if not tool_calls:
+        raise ValueError("The completion did not call summarize_forecasts.")
+    try:
+        summaries = json.loads(tool_calls[0].function.arguments)["summaries"]
+        return {
+            str(summary["event_id"]): {
+                "content": summary["summary"],
+                "role": "assistant",
+                "function_call": None,
+                "tool_calls": None,
+            }
+            for summary in summaries
+            if str(summary["event_id"]) in requests
+            and isinstance(summary["summary"], str)
+        }
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed summarize_forecasts call: {e!r}") from e
+
+
+async def summarize_forecasts(forecasts: list):
+    """
+    Summarize filtered forecasts with as few completions as possible.
+
+    Stored and cached summaries are reused as in Forecast.summarize_forecast.
+    The rest are deduplicated by summary_key and sent in batches, by
+    batch_by_tokens, of one completion each with at most SUMMARY_CONCURRENCY
+    in flight. Events a batch's reply cannot be parsed for fall back to a
+    completion of their own. Keys already being summarized by another request
+    wait for that summary instead, and other requests wait for these.
+    """
+    pending = {}
+    waiting = {}
+    for forecast in forecasts:
+        if forecast.reuse_stored_summary():
+            continue
+        key = forecast.forecast["summary_key"]
+        if key in pending:
+            pending[key].append(forecast)
+            continue
+        if key in waiting:
+            waiting[key][1].append(forecast)
+            continue
+        cached = await summary_cache.get(key)
+        if cached is not None:
+            forecast.forecast["chatgpt_summary"] = cached
+            continue
+        inflight = summary_cache.begin_fetch(key)
+        if inflight is not None:
+            waiting[key] = (inflight, [forecast])
+        else:
+            pending[key] = [forecast]
+
+    keys = list(pending)
+    requests = {}
+    for i, key in enumerate(keys):
+        summary_id = pending[key][0].event_id or str(i)
+        requests[key] = (summary_id, _summary_request(pending[key][0], summary_id))
+    batches = batch_by_tokens(keys, [len(requests[key][1]) // 4 for key in keys])
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def finish(key, summary, error: Exception = None):
+        if summary is not None:
+            await summary_cache.set(key, summary, pending[key][0].summary_ttl())
+        for forecast in pending[key]:
+            forecast.forecast["chatgpt_summary"] = summary
+        summary_cache.end_fetch(key, summary, error)
+
+    async def summarize_one(key):
+        try:
+            async with semaphore:
+                summary = await pending[key][0].create_summary()
+        except UPSTREAM_EXCEPTIONS as e:
+            logger.warning("Summary unavailable: %r", e)
+            return await finish(key, None, e)
+        await finish(key, summary)
+
+    async def summarize_batch(batch):
+        if len(batch) == 1:
+            return await summarize_one(batch[0])
+        try:
+            async with semaphore:
+                summaries = await create_summaries(dict(requests[key] for key in batch))
+        except UPSTREAM_EXCEPTIONS as e:
+            logger.warning("Summaries unavailable: %r", e)
+            for key in batch:
+                await finish(key, None, e)
+            return
+        except ValueError as e:
+            logger.warning("Summarizing events one by one: %r", e)
+            summaries = {}
+
+        missing = []
+        for key in batch:
+            summary = summaries.get(requests[key][0])
+            if summary is None:
+                missing.append(key)
+            else:
+                await finish(key, summary)
+        await asyncio.gather(*[summarize_one(key) for key in missing])
+
+    async def wait_for(key):
+        inflight, waiters = waiting[key]
+        try:
+            summary = await asyncio.shield(inflight)
+        except UPSTREAM_EXCEPTIONS:
+            summary = None
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                raise
+            # The other request gave up on it, so summarize it here.
+            await waiters[0].summarize_forecast()
+            summary = waiters[0].forecast["chatgpt_summary"]
+        for forecast in waiters:
+            forecast.forecast["chatgpt_summary"] = summary
+
+    try:
+        await asyncio.gather(
+            *[summarize_batch(batch) for batch in batches],
+            *[wait_for(key) for key in waiting],
+        )
+    finally:
+        # Release any key left unsummarized by an error or cancellation.
+        for key in pending:
+            summary_cache.end_fetch(key, error=asyncio.CancelledError())
+
+
+async def _filter_forecasts(forecasts: list) -> dict:
+    """
+    Fetch each distinct grid cell once, the cells concurrently, and filter the
+    forecasts in it. Fresh stored forecasts are kept, and forecasts in cells
+    that cannot be fetched, even stale, fall back to the stored forecast.
+    Returns the filtered forecasts by grid cell.
+    """
+    cells = {}
+    for forecast in forecasts:
+        if forecast.fresh():
+            forecast.forecast = forecast.stored_forecast
+        elif forecast.forecastable():
+            cells.setdefault(forecast.grid_cell, []).append(forecast)
+
+    hourlies = await asyncio.gather(
+        *[_get_hourly_forecast(*cell) for cell in cells], return_exceptions=True
+    )
+    for cell, hourly in zip(list(cells), hourlies):
+        if isinstance(hourly, UPSTREAM_EXCEPTIONS):
+            logger.warning("Forecast unavailable for %s/%s,%s: %r", *cell, hourly)
+            for forecast in cells.pop(cell):
+                forecast.use_stored_forecast()
+            continue
+        if isinstance(hourly, BaseException):
+            raise hourly
+        for forecast in cells[cell]:
+            forecast.use_hourly_forecast(hourly)
+            forecast.filter_forecast()
+    return cells
+
+
+async def forecast_events(events: list) -> list:
+    """
+    Attach a forecast to each event dictionary and return the events in their
+    original order. Events whose stored forecast is still fresh keep it.
+
+    Events are grouped by grid cell so each distinct cell is fetched once and
+    the cells are fetched concurrently. Summaries are batched by
+    summarize_forecasts.
+
+    Events in cells whose forecast cannot be fetched, even stale, keep their
+    stored forecast marked stale rather than failing the whole batch.
+    """
+    forecasts = [Forecast(event) for event in events]
+    cells = await _filter_forecasts(forecasts)
+    await summarize_forecasts(
+        [forecast for cell_forecasts in cells.values() for forecast in cell_forecasts]
+    )
+
+    for event, forecast in zip(events, forecasts):
+        event["forecast"] = forecast.forecast
+    return events
+
+
+async def iter_filtered_events(events, batch_size: int = CELL_BATCH_SIZE):
+    """
+    Yield the events from the async iterable events with their forecast
+    filtered to each event's window, without asking for summaries.
+
+    Events are read batch_size at a time, and every distinct grid cell in a
+    batch is fetched once, so events should arrive grouped by cell.
+    """
+    batch = []
+
+    async def flush():
+        forecasts = [Forecast(event) for event in batch]
+        await _filter_forecasts(forecasts)
+        for event, forecast in zip(batch, forecasts):
+            event["forecast"] = forecast.forecast
+        return batch
+
+    async for event in events:
+        batch.append(event)
+        if len(batch) >= batch_size:
+            for event in await flush():
+                yield event
+            batch = []
+    if batch:
+        for event in await flush():
+            yield event
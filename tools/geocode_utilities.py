@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import collections
+import csv
+import datetime
+import difflib
+import time
+from array import array
+from typing import Optional
+from tools.metrics_utilities import GEOCODE_CALLS, GEOCODE_HEDGES
+from tools.resilience_utilities import RetryBudget, get_circuit_breaker
+
+# A misspelled address matches a venue only when the rest of the address is
+# the same and its street name and city are at least this similar, from 0 to
+# 1, and this few characters apart.
+FUZZY_MATCH_RATIO = 0.9
+FUZZY_MAX_EDITS = 2
+
+# Trailing words an address may add to a known venue and still match it.
+NON_LOCATING_SUFFIXES = frozenset(
+    ["us", "usa", "united states", "united states of america"]
+)
+
+# Words of a normalized address that must match exactly for a misspelling to
+# match: directions and street types, alongside any word with a digit in it,
+# such as the house number, a numbered street or the ZIP code.
+ADDRESS_KEYWORDS = frozenset(
+    """
+    n s e w ne nw se sw st ave rd dr blvd ln ct pl pkwy hwy ter cir sq ste apt
+    """.split()
+)
+
+# Successful call latencies kept per provider, and how many are needed before
+# its p95 is trusted to decide when to hedge.
+GEOCODE_LATENCY_WINDOW = 200
+GEOCODE_HEDGE_MIN_SAMPLES = 20
+# Fraction of a provider's daily quota kept for fallbacks rather than hedges.
+GEOCODE_HEDGE_QUOTA_RESERVE = 0.1
+
+
+def _split_address(words: list) -> tuple[list, str]:
+    """
+    Split the words of a normalized address into those that must match
+    exactly and the rest, the street name and city, as one string.
+    """
+    keys, rest = [], []
+    for word in words:
+        if word in ADDRESS_KEYWORDS or any(c.isdigit() for c in word):
+            keys.append(word)
+        else:
+            rest.append(word)
+    return keys, " ".join(rest)
+
+
+def _typo_edits(a: str, b: str) -> Optional[int]:
+    """
+    The characters changed between a and b, or None when they are less than
+    FUZZY_MATCH_RATIO similar.
+    """
+    matcher = difflib.SequenceMatcher(a=a, b=b)
+    if matcher.quick_ratio() < FUZZY_MATCH_RATIO or matcher.ratio() < FUZZY_MATCH_RATIO:
+        return None
+    return sum(
+        max(i2 - i1, j2 - j1)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    )
+
+
+class GeocodeIndex:
+
+    def __init__(self, venues: list = (), zips: dict = None):
+        """
+        Coordinates of known venues and ZIP code centroids, looked up without
+        any network call.
+
+        venues is a list of (address, lat, lon) with the addresses already
+        normalized; they are kept sorted, with the coordinates in typed arrays
+        alongside, so lookups are a binary search. zips maps five digit ZIP
+        codes to (lat, lon).
+        """
+        venues = sorted(venues)
+        self.addresses = [venue[0] for venue in venues]
+        self.lats = array("d", (venue[1] for venue in venues))
+        self.lons = array("d", (venue[2] for venue in venues))
+        self.zips = dict(zips or {})
+
+    def __len__(self):
+        return len(self.addresses) + len(self.zips)
+
+    def _location(self, i: int) -> tuple[float, float]:
+        return self.lats[i], self.lons[i]
+
+    def lookup(self, address: str) -> Optional[tuple[float, float]]:
+        """
+        The coordinates for a normalized address, or None when it is not
+        known. In order, this tries:
+        - the exact venue
+        - the one venue the address is a prefix of, such as an address
+          without its ZIP code
+        - a venue the address extends only by words that add no location,
+          such as a trailing country
+        - the one closest venue with the same house number, directions,
+          street type and ZIP code whose street name and city are within a
+          small typo of the address's
+
+        Addresses without a house number fall back to their ZIP code's
+        centroid. Street addresses do not, since a centroid can be in another
+        NWS grid cell.
+        """
+        addresses = self.addresses
+        i = bisect.bisect_left(addresses, address)
+        if i < len(addresses) and addresses[i] == address:
+            return self._location(i)
+        prefix = address + " "
+        if (
+            i < len(addresses)
+            and addresses[i].startswith(prefix)
+            and not (i + 1 < len(addresses) and addresses[i + 1].startswith(prefix))
+        ):
+            return self._location(i)
+        if (
+            i > 0
+            and address.startswith(addresses[i - 1] + " ")
+            and address[len(addresses[i - 1]) + 1 :] in NON_LOCATING_SUFFIXES
+        ):
+            return self._location(i - 1)
+
+        words = address.split()
+        if not words:
+            return None
+        if words[0].isdigit():
+            first = bisect.bisect_left(addresses, words[0] + " ")
+            last = bisect.bisect_left(addresses, words[0] + "!", first)
+            keys, name = _split_address(words)
+            best, best_edits = [], FUZZY_MAX_EDITS
+            for j in range(first, last):
+                venue_keys, venue_name = _split_address(addresses[j].split())
+                if venue_keys != keys:
+                    continue
+                edits = _typo_edits(name, venue_name)
+                if edits is None or edits > best_edits:
+                    continue
+                if edits < best_edits:
+                    best, best_edits = [], edits
+                best.append(j)
+            # Two venues equally close to a misspelling are ambiguous.
+            return self._location(best[0]) if len(best) == 1 else None
+
+        for word in reversed(words):
+            if len(word) == 5 and word.isdigit() and word in self.zips:
+                return self.zips[word]
+        return None
+
+
+def read_locations(path: str, key: str) -> list:
+    """
+    Read (key, lat, lon) rows from a CSV file with key, lat and lon columns.
+    """
+    with open(path, newline="") as f:
+        return [
+            (row[key], float(row["lat"]), float(row["lon"]))
+            for row in csv.DictReader(f)
+        ]
+
+
+class GeocodeProvider:
+
+    def __init__(self, name: str, host: str, fetch, daily_quota: int = None):
+        """
+        A geocoding API: fetch(address) is a coroutine function returning
+        (lat, lon). Tracks the latency of recent calls that did not fail and the
+        calls made today (UTC) against daily_quota, None being unlimited.
+        """
+        self.name = name
+        self.host = host
+        self.fetch = fetch
+        self.daily_quota = daily_quota
+        self.latencies = collections.deque(maxlen=GEOCODE_LATENCY_WINDOW)
+        self.day = None
+        self.calls_today = 0
+
+    def _today(self) -> int:
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self.day:
+            self.day, self.calls_today = today, 0
+        return self.calls_today
+
+    def available(self, reserve: float = 0) -> bool:
+        """
+        Whether the provider's circuit is not open and it has quota left,
+        keeping reserve of the quota unused.
+        """
+        if get_circuit_breaker(self.host).state == "open":
+            return False
+        if self.daily_quota is None:
+            return True
+        return self._today() < self.daily_quota * (1 - reserve)
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < GEOCODE_HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    async def geocode(self, address: str) -> tuple[float, float]:
+        self._today()
+        self.calls_today += 1
+        start = time.perf_counter()
+        try:
+            location = await self.fetch(address)
+        except asyncio.CancelledError:
+            # Losing a hedge still took at least this long, and leaving it out
+            # would drag the p95 down.
+            self.latencies.append(time.perf_counter() - start)
+            raise
+        self.latencies.append(time.perf_counter() - start)
+        return location
+
+
+class GeocodeRouter:
+
+    def __init__(self, providers: list, hedge_ratio: float = 0.1):
+        """
+        Geocode with the first available provider, in order of preference,
+        falling back to the next when one fails.
+
+        When the provider in use has not answered within its p95 latency, the
+        next one is called as well and the first valid answer is taken. Hedges
+        are limited to hedge_ratio of geocoding calls and never spend a
+        provider's quota reserve, so they cannot double quota use.
+        """
+        self.providers = providers
+        self.hedge_budget = RetryBudget(hedge_ratio)
+
+    async def geocode(self, address: str) -> tuple[float, float]:
+        if not self.providers:
+            raise ValueError("No geocoding provider is configured.")
+        providers = [provider for provider in self.providers if provider.available()]
+        if not providers:
+            providers = self.providers[:1]
+        self.hedge_budget.deposit()
+        tasks = {}
+        error = None
+
+        def start(provider):
+            tasks[asyncio.ensure_future(provider.geocode(address))] = provider
+
+        start(providers.pop(0))
+        hedged = False
+        try:
+            while tasks:
+                hedge_after = None
+                if providers and not hedged:
+                    hedge_after = next(iter(tasks.values())).p95()
+                done, _ = await asyncio.wait(
+                    tasks, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Hedge at most once, and only within budget and quota.
+                    hedged = True
+                    if (
+                        providers[0].available(GEOCODE_HEDGE_QUOTA_RESERVE)
+                        and self.hedge_budget.withdraw()
+                    ):
+                        GEOCODE_HEDGES.labels(providers[0].name).inc()
+                        start(providers.pop(0))
+                    continue
+                for task in done:
+                    provider = tasks.pop(task)
+                    if task.exception() is None:
+                        GEOCODE_CALLS.labels(provider.name, "won").inc()
+                        return task.result()
+                    GEOCODE_CALLS.labels(provider.name, "failed").inc()
+                    error = error or task.exception()
+                if not tasks and providers:
+                    start(providers.pop(0))
+            raise error
+        finally:
+            for task, provider in tasks.items():
+                task.cancel()
+                GEOCODE_CALLS.labels(provider.name, "cancelled").inc()
@@ -0,0 +1,156 @@
+import json
+import math
+import os
+from typing import Optional
+
+# The NDFD 2.5 km CONUS grid, which every forecast office grid is a window of:
+# a Lambert conformal projection of a sphere with one standard parallel.
+EARTH_RADIUS = 6371200.0
+STANDARD_PARALLEL = math.radians(25)
+CENTRAL_MERIDIAN = math.radians(-95)
+GRID_SPACING = 2539.703
+GRID_ORIGIN = (20.191999, -121.554001)
+
+# Verified API results an office needs before its cells are resolved offline.
+GRID_INDEX_MIN_SAMPLES = 3
+# Points are bucketed into tiles of this many degrees to record which office
+# covers them.
+GRID_TILE_DEGREES = 0.1
+
+_N = math.sin(STANDARD_PARALLEL)
+_F = (
+    math.cos(STANDARD_PARALLEL)
+    * math.tan(math.pi / 4 + STANDARD_PARALLEL / 2) ** _N
+    / _N
+)
+
+
+def _project(lat: float, lon: float) -> tuple[float, float]:
+    rho = EARTH_RADIUS * _F / math.tan(math.pi / 4 + math.radians(lat) / 2) ** _N
+    theta = _N * (math.radians(lon) - CENTRAL_MERIDIAN)
+    return rho * math.sin(theta), -rho * math.cos(theta)
+
+
+_ORIGIN = _project(*GRID_ORIGIN)
+
+
+def ndfd_position(lat: float, lon: float) -> tuple[float, float]:
+    """
+    The fractional column and row of a point on the NDFD CONUS grid.
+    """
+    x, y = _project(lat, lon)
+    return (x - _ORIGIN[0]) / GRID_SPACING, (y - _ORIGIN[1]) / GRID_SPACING
+
+
+def _tile(lat: float, lon: float) -> tuple[int, int]:
+    return math.floor(lat / GRID_TILE_DEGREES), math.floor(lon / GRID_TILE_DEGREES)
+
+
+class GridIndex:
+
+    def __init__(self, offices: dict = None, tiles: dict = None):
+        """
+        Resolve points to NWS gridpoints without calling api.weather.gov.
+
+        An office's gridX is floor(column + a) for its NDFD column and some
+        shift a, and likewise for gridY. Each API result added narrows the
+        range of shifts consistent with everything seen for that office;
+        offices whose results fit no single shift, such as those outside
+        CONUS, are never resolved offline. offices maps gridId to the "x" and
+        "y" (low, high) bounds on the shift and the "samples" behind them.
+
+        tiles maps each tile of the map to the offices seen covering it. A
+        point is only resolved when its tile and the eight tiles around it
+        have all been seen, all covered by the same single office.
+        """
+        self.offices = offices or {}
+        self.tiles = {key: set(gridIds) for key, gridIds in (tiles or {}).items()}
+
+    def __len__(self):
+        return len(self.offices)
+
+    def add(self, lat: float, lon: float, gridId: str, gridX: int, gridY: int) -> bool:
+        """
+        Record a gridpoint from the API. Returns whether it agreed with what
+        lookup would have answered, or True when lookup had no answer.
+        """
+        expected = self.lookup(lat, lon)
+        column, row = ndfd_position(lat, lon)
+        office = self.offices.setdefault(
+            gridId, {"x": [-math.inf, math.inf], "y": [-math.inf, math.inf]}
+        )
+        for axis, grid, position in [("x", gridX, column), ("y", gridY, row)]:
+            # floor(position + a) == grid holds for grid - position <= a <
+            # grid - position + 1.
+            low, high = office[axis]
+            office[axis] = [max(low, grid - position), min(high, grid - position + 1)]
+        office["samples"] = office.get("samples", 0) + 1
+        self.tiles.setdefault(_tile(lat, lon), set()).add(gridId)
+        return expected is None or expected == (gridId, gridX, gridY)
+
+    def _office(self, lat: float, lon: float) -> Optional[str]:
+        tile_lat, tile_lon = _tile(lat, lon)
+        gridIds = set()
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                tile = (tile_lat + d_lat, tile_lon + d_lon)
+                # An unseen neighbour could be another office's.
+                if tile not in self.tiles:
+                    return None
+                gridIds |= self.tiles[tile]
+        if len(gridIds) != 1:
+            return None
+        return gridIds.pop()
+
+    def lookup(self, lat: float, lon: float) -> Optional[tuple[str, int, int]]:
+        """
+        The (gridId, gridX, gridY) for a point, or None unless every shift
+        consistent with the office's verified results gives the same cell.
+        """
+        gridId = self._office(lat, lon)
+        if gridId is None:
+            return None
+        office = self.offices.get(gridId)
+        if office is None or office.get("samples", 0) < GRID_INDEX_MIN_SAMPLES:
+            return None
+        cell = [gridId]
+        for axis, position in zip(("x", "y"), ndfd_position(lat, lon)):
+            low, high = office[axis]
+            if low >= high:
+                return None
+            grid = math.floor(position + low)
+            # The shift can be anything below high, so high itself is excluded.
+            if math.ceil(position + high) - 1 != grid:
+                return None
+            cell.append(grid)
+        return tuple(cell)
+
+    def save(self, path: str):
+        """
+        Snapshot the index to a JSON file, replaced atomically.
+        """
+        snapshot = {
+            "offices": self.offices,
+            "tiles": {
+                f"{tile_lat}:{tile_lon}": sorted(gridIds)
+                for (tile_lat, tile_lon), gridIds in self.tiles.items()
+            },
+        }
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "GridIndex":
+        """
+        Read a snapshot written by save, or an empty index when there is none.
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            snapshot = json.load(f)
+        tiles = {}
+        for key, gridIds in snapshot.get("tiles", {}).items():
+            tile_lat, tile_lon = key.split(":")
+            tiles[(int(tile_lat), int(tile_lon))] = gridIds
+        return cls(snapshot.get("offices", {}), tiles)
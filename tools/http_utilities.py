@@ -0,0 +1,83 @@
+import asyncio
+import urllib.parse
+import httpx
+from dotenv import dotenv_values
+from tools.metrics_utilities import UPSTREAM_ERRORS
+from tools.resilience_utilities import UPSTREAM_DEADLINE, call_upstream
+
+config = dotenv_values(".env")
+
+HTTP_TIMEOUT = httpx.Timeout(
+    float(config.get("HTTP_TIMEOUT", 10)),
+    connect=float(config.get("HTTP_CONNECT_TIMEOUT", 3)),
+)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(config.get("HTTP_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(config.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)),
+    keepalive_expiry=30,
+)
+MAX_CONNECTIONS_PER_HOST = int(config.get("HTTP_MAX_CONNECTIONS_PER_HOST", 10))
+
+# api.weather.gov rejects requests without a User-Agent identifying the app.
+HTTP_HEADERS = {"User-Agent": config.get("HTTP_USER_AGENT", "raincheck")}
+
+_client = None
+_host_semaphores = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the keep-alive client shared by every upstream call in the app.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, headers=HTTP_HEADERS
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_semaphores.clear()
+
+
+def _get_host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urllib.parse.urlsplit(url).netloc
+    if host not in _host_semaphores:
+        _host_semaphores[host] = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+    return _host_semaphores[host]
+
+
+async def _get(url: str, host: str, **kwargs) -> httpx.Response:
+    try:
+        async with _get_host_semaphore(url):
+            r = await get_http_client().get(url, **kwargs)
+        r.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        UPSTREAM_ERRORS.labels(host, str(e.response.status_code)).inc()
+        raise
+    except httpx.HTTPError as e:
+        UPSTREAM_ERRORS.labels(host, type(e).__name__).inc()
+        raise
+    return r
+
+
+async def http_get(
+    url: str, deadline: float = UPSTREAM_DEADLINE, **kwargs
+) -> httpx.Response:
+    """
+    GET url with the shared client, holding at most MAX_CONNECTIONS_PER_HOST
+    requests in flight per host, and raise for error statuses. Failures are
+    counted by host and status code or error type.
+
+    Requests go through the host's circuit breaker and are retried on 5xx,
+    429 and connection errors, all within deadline seconds.
+    """
+    host = urllib.parse.urlsplit(url).netloc
+    return await call_upstream(
+        host, lambda: _get(url, host, **kwargs), deadline=deadline
+    )
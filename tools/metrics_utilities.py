@@ -0,0 +1,160 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from dotenv import dotenv_values
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.openmetrics import exposition as openmetrics
+
+config = dotenv_values(".env")
+
+logger = logging.getLogger("raincheck")
+
+# From a warm cache hit to a slow OpenAI completion.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "raincheck_stage_seconds",
+    "Time spent in each stage of serving a request.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "raincheck_stage_errors_total",
+    "Exceptions raised by each stage.",
+    ["stage", "error"],
+)
+CACHE_REQUESTS = Counter(
+    "raincheck_cache_requests_total",
+    "Cache lookups by cache and result (hit, redis_hit or miss).",
+    ["cache", "result"],
+)
+UPSTREAM_ERRORS = Counter(
+    "raincheck_upstream_errors_total",
+    "Failed upstream HTTP requests by host and status code or error.",
+    ["host", "error"],
+)
+RETRIES = Counter(
+    "raincheck_upstream_retries_total",
+    "Upstream calls retried, by host.",
+    ["host"],
+)
+CIRCUIT_REJECTIONS = Counter(
+    "raincheck_circuit_rejections_total",
+    "Upstream calls failed fast because the host's circuit was open.",
+    ["host"],
+)
+STALE_SERVED = Counter(
+    "raincheck_stale_served_total",
+    "Expired cache entries served because the upstream failed, by cache.",
+    ["cache"],
+)
+GEOCODE_CALLS = Counter(
+    "raincheck_geocode_calls_total",
+    "Geocoding provider calls by provider and outcome (won, failed or cancelled).",
+    ["provider", "outcome"],
+)
+GEOCODE_HEDGES = Counter(
+    "raincheck_geocode_hedges_total",
+    "Hedged geocoding calls, by the provider called because another was slow.",
+    ["provider"],
+)
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+# Caller trace IDs are exemplar labels, which Prometheus caps at 128
+# characters, so anything longer or unusual is replaced.
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9-]{1,64}")
+
+
+def new_trace_id(trace_id: str = None) -> str:
+    """
+    Set the trace ID for the current request, generating one when the
+    caller did not send a valid one, and return it.
+    """
+    if not trace_id or not TRACE_ID_PATTERN.fullmatch(trace_id):
+        trace_id = uuid.uuid4().hex
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get() or "-"
+        return True
+
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceIdFilter())
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s [%(trace_id)s] %(message)s")
+    )
+    logger.addHandler(handler)
+    logger.setLevel(config.get("LOG_LEVEL", "INFO").upper())
+
+
+@contextmanager
+def measure(stage: str):
+    """
+    Observe the time spent in the block under stage, counting exceptions by
+    type. Observations carry the request's trace ID as an exemplar.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.labels(stage, type(e).__name__).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        trace_id = trace_id_var.get()
+        STAGE_SECONDS.labels(stage).observe(
+            elapsed, exemplar={"trace_id": trace_id} if trace_id else None
+        )
+        logger.debug("stage=%s seconds=%.4f", stage, elapsed)
+
+
+def timed(stage: str):
+    """
+    Decorate a function or coroutine function to be measured under stage.
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with measure(stage):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with measure(stage):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def generate_metrics(accept: str = "") -> tuple[bytes, str]:
+    """
+    The metrics in the Prometheus text format, or in OpenMetrics, which
+    includes the trace ID exemplars, when the scraper accepts it.
+    """
+    if "application/openmetrics-text" in accept:
+        return openmetrics.generate_latest(REGISTRY), openmetrics.CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,40 +1,158 @@
+import random
+import re
 import urllib.parse
-from functools import lru_cache
-import requests
 from dotenv import dotenv_values
+from tools.cache_utilities import TTLCache, get_redis_client
+from tools.geocode_utilities import (
+    GeocodeIndex,
+    GeocodeProvider,
+    GeocodeRouter,
+    read_locations,
+)
+from tools.grid_utilities import GridIndex
+from tools.http_utilities import http_get
+from tools.metrics_utilities import CACHE_REQUESTS, logger, timed
 
 
 config = dotenv_values(".env")
 
-
-@lru_cache
-def _get_lat_lon_for_address_google(address_str: str) -> tuple[float, float]:
+# Addresses and coordinates do not move, so keep lookups for a long time.
+GEOCODE_TTL = 60 * 60 * 24 * 30
+GEOCODE_CACHE_SIZE = int(config.get("GEOCODE_CACHE_SIZE", 10000))
+
+# Lookups are kept in process and, with REDIS_URL set, in Redis so they survive
+# restarts and are shared between workers instead of spending HERE quota again.
+geocode_cache = TTLCache("geocode", get_redis_client(), GEOCODE_CACHE_SIZE)
+gridpoint_cache = TTLCache("gridpoint", get_redis_client(), GEOCODE_CACHE_SIZE)
+
+# Known venues and ZIP code centroids, geocoded without calling HERE.
+GEOCODE_VENUES_PATH = config.get("GEOCODE_VENUES_PATH")
+GEOCODE_ZIPS_PATH = config.get("GEOCODE_ZIPS_PATH")
+# Geocoding providers in order of preference, each used when its API key is
+# set, with optional daily call quotas. A slow call to one is hedged with the
+# next for at most GEOCODE_HEDGE_RATIO of calls.
+GEOCODE_PROVIDERS = [
+    name.strip()
+    for name in config.get("GEOCODE_PROVIDERS", "here,google").split(",")
+    if name.strip()
+]
+GEOCODE_API_KEYS = {"here": "HERE_API_KEY", "google": "GOOGLE_API_KEY"}
+if set(GEOCODE_PROVIDERS) - set(GEOCODE_API_KEYS):
+    raise ValueError(
+        f"Unknown GEOCODE_PROVIDERS {GEOCODE_PROVIDERS}, expected some of "
+        f"{list(GEOCODE_API_KEYS)}."
+    )
+GEOCODE_HEDGE_RATIO = float(config.get("GEOCODE_HEDGE_RATIO", 0.1))
+HERE_DAILY_QUOTA = config.get("HERE_DAILY_QUOTA")
+GOOGLE_DAILY_QUOTA = config.get("GOOGLE_DAILY_QUOTA")
+
+# Snapshot of the offline gridpoint index, loaded at import and written back
+# with what api.weather.gov answered since on shutdown.
+GRID_INDEX_PATH = config.get("GRID_INDEX_PATH")
+# Fraction of its answers checked against api.weather.gov anyway, so a wrong
+# answer is caught and stops the index answering for that area.
+GRID_INDEX_VERIFY_RATIO = float(config.get("GRID_INDEX_VERIFY_RATIO", 0.05))
+
+
+class AddressNotFoundError(ValueError):
+    pass
+
+
+# USPS standard abbreviations, so "123 Main Street" and "123 main st" share
+# one cache entry.
+ADDRESS_ABBREVIATIONS = {
+    "street": "st",
+    "avenue": "ave",
+    "road": "rd",
+    "drive": "dr",
+    "boulevard": "blvd",
+    "lane": "ln",
+    "court": "ct",
+    "place": "pl",
+    "parkway": "pkwy",
+    "highway": "hwy",
+    "terrace": "ter",
+    "circle": "cir",
+    "square": "sq",
+    "suite": "ste",
+    "apartment": "apt",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "northeast": "ne",
+    "northwest": "nw",
+    "southeast": "se",
+    "southwest": "sw",
+}
+
+
+def normalize_address(address_str: str) -> str:
+    """
+    Lowercase the address, drop punctuation and abbreviate common words.
+    """
+    words = re.sub(r"[^\w\s#]", " ", address_str.lower()).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def load_geocode_index(venues_path: str = None, zips_path: str = None):
+    """
+    Build the GeocodeIndex from a CSV of venues with address, lat and lon
+    columns and a CSV of ZIP code centroids with zip, lat and lon columns.
+    Either may be left out. geocode_index.py exports the venues of stored
+    events.
+    """
+    venues = []
+    if venues_path:
+        venues = [
+            (normalize_address(address), lat, lon)
+            for address, lat, lon in read_locations(venues_path, "address")
+        ]
+    zips = {}
+    if zips_path:
+        zips = {
+            zip_code.zfill(5): (lat, lon)
+            for zip_code, lat, lon in read_locations(zips_path, "zip")
+        }
+    index = GeocodeIndex(venues, zips)
+    if index:
+        logger.info(
+            "Geocode index has %s venues and %s ZIP codes.", len(venues), len(zips)
+        )
+    return index
+
+
+def save_grid_index():
+    if GRID_INDEX_PATH:
+        grid_index.save(GRID_INDEX_PATH)
+
+
+@timed("geocode_google")
+async def _fetch_lat_lon_for_address_google(address_str: str) -> tuple[float, float]:
 
     address_encoded = urllib.parse.quote_plus(address_str)
 
-    r = requests.get(
+    r = await http_get(
         f'https://maps.googleapis.com/maps/api/geocode/json?key={config["GOOGLE_API_KEY"]}&address={address_encoded}'
     )
-    r.raise_for_status()
     if r.json()["status"] == "ZERO_RESULTS":
-        raise ValueError("The address provided returned no results.")
+        raise AddressNotFoundError("The address provided returned no results.")
     lat = r.json()["results"][0]["geometry"]["location"]["lat"]
     lon = r.json()["results"][0]["geometry"]["location"]["lng"]
 
     return lat, lon
 
 
-@lru_cache
-def _get_lat_lon_for_address_here(address_str: str) -> tuple[float, float]:
+@timed("geocode_here")
+async def _fetch_lat_lon_for_address_here(address_str: str) -> tuple[float, float]:
 
     address_encoded = urllib.parse.quote_plus(address_str)
 
-    r = requests.get(
+    r = await http_get(
         f'https://geocode.search.hereapi.com/v1/geocode?apiKey={config["HERE_API_KEY"]}&q={address_encoded}'
     )
-    r.raise_for_status()
     if not r.json()["items"]:
-        raise ValueError("The address provided returned no results.")
+        raise AddressNotFoundError("The address provided returned no results.")
 
     lat = r.json()["items"][0]["position"]["lat"]
     lon = r.json()["items"][0]["position"]["lng"]
@@ -42,12 +160,89 @@ def _get_lat_lon_for_address_here(address_str: str) -> tuple[float, float]:
     return lat, lon
 
 
-@lru_cache
-def _get_gridpoints_by_lat_lon(lat: float, lon: float) -> tuple[str, int, int]:
-    r = requests.get(f"https://api.weather.gov/points/{lat},{lon}")
-    r.raise_for_status()
+_geocode_router = None
+
+
+def get_geocode_router() -> GeocodeRouter:
+    global _geocode_router
+    if _geocode_router is None:
+        providers = {
+            "here": GeocodeProvider(
+                "here",
+                "geocode.search.hereapi.com",
+                _fetch_lat_lon_for_address_here,
+                int(HERE_DAILY_QUOTA) if HERE_DAILY_QUOTA else None,
+            ),
+            "google": GeocodeProvider(
+                "google",
+                "maps.googleapis.com",
+                _fetch_lat_lon_for_address_google,
+                int(GOOGLE_DAILY_QUOTA) if GOOGLE_DAILY_QUOTA else None,
+            ),
+        }
+        _geocode_router = GeocodeRouter(
+            [
+                providers[name]
+                for name in GEOCODE_PROVIDERS
+                if config.get(GEOCODE_API_KEYS[name])
+            ],
+            GEOCODE_HEDGE_RATIO,
+        )
+    return _geocode_router
+
+
+async def _get_lat_lon_for_address(address_str: str) -> tuple[float, float]:
+    """
+    Geocode from the local index of known venues and ZIP codes when it has
+    the address, otherwise from the geocoding providers.
+    """
+    address = normalize_address(address_str)
+    location = geocode_index.lookup(address)
+    if location is not None:
+        CACHE_REQUESTS.labels("geocode_index", "hit").inc()
+        return location
+    CACHE_REQUESTS.labels("geocode_index", "miss").inc()
+
+    async def fetch():
+        return await get_geocode_router().geocode(address_str), GEOCODE_TTL
+
+    lat, lon = await geocode_cache.get_or_fetch(address, fetch)
+    return lat, lon
+
+
+@timed("nws_gridpoints")
+async def _fetch_gridpoints_by_lat_lon(lat: float, lon: float) -> tuple[str, int, int]:
+    r = await http_get(f"https://api.weather.gov/points/{lat},{lon}")
     gridId = r.json()["properties"]["gridId"]
     gridX = r.json()["properties"]["gridX"]
     gridY = r.json()["properties"]["gridY"]
 
     return gridId, gridX, gridY
+
+
+async def _get_gridpoints_by_lat_lon(lat: float, lon: float) -> tuple[str, int, int]:
+    # api.weather.gov resolves points to four decimal places.
+    lat, lon = round(lat, 4), round(lon, 4)
+    gridpoints = grid_index.lookup(lat, lon)
+    if gridpoints is None:
+        CACHE_REQUESTS.labels("grid_index", "miss").inc()
+    elif random.random() < GRID_INDEX_VERIFY_RATIO:
+        CACHE_REQUESTS.labels("grid_index", "verify").inc()
+    else:
+        CACHE_REQUESTS.labels("grid_index", "hit").inc()
+        return gridpoints
+
+    async def fetch():
+        gridpoints = await _fetch_gridpoints_by_lat_lon(lat, lon)
+        if not grid_index.add(lat, lon, *gridpoints):
+            logger.warning(
+                "Grid index disagreed with api.weather.gov at %s,%s.", lat, lon
+            )
+        return gridpoints, GEOCODE_TTL
+
+    gridId, gridX, gridY = await gridpoint_cache.get_or_fetch((lat, lon), fetch)
+    return gridId, gridX, gridY
+
+
+geocode_index = load_geocode_index(GEOCODE_VENUES_PATH, GEOCODE_ZIPS_PATH)
+grid_index = GridIndex.load(GRID_INDEX_PATH)
@@ -0,0 +1,190 @@
+import asyncio
+import random
+import time
+import httpx
+import openai
+from dotenv import dotenv_values
+from tools.metrics_utilities import CIRCUIT_REJECTIONS, RETRIES, logger
+
+config = dotenv_values(".env")
+
+# Attempts per upstream call, including the first.
+UPSTREAM_ATTEMPTS = int(config.get("UPSTREAM_ATTEMPTS", 3))
+# Hard limit in seconds on one upstream call, across all of its attempts.
+UPSTREAM_DEADLINE = float(config.get("UPSTREAM_DEADLINE", 10))
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2
+
+# Retries may add at most this fraction of extra load across all upstreams, so
+# a struggling upstream is not hit with every caller's retries at once.
+RETRY_BUDGET_RATIO = float(config.get("RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN = 10
+
+# Consecutive failures that open a host's circuit, and seconds before one
+# trial call is let through again.
+CIRCUIT_FAILURE_THRESHOLD = int(config.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(config.get("CIRCUIT_RESET_TIMEOUT", 30))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Anything an upstream call can end with once retries are given up.
+UPSTREAM_EXCEPTIONS = (
+    httpx.HTTPError,
+    asyncio.TimeoutError,
+    CircuitOpenError,
+    openai.APIError,
+)
+
+
+class CircuitBreaker:
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        """
+        Fail calls to host fast once failure_threshold calls in a row have
+        failed. After reset_timeout one trial call is let through; its success
+        closes the circuit and its failure keeps it open for another period.
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            CIRCUIT_REJECTIONS.labels(self.host).inc()
+            raise CircuitOpenError(f"Circuit for {self.host} is open.")
+        if state == "half-open":
+            self._trial_in_flight = True
+
+    def release_trial(self):
+        """
+        Let another trial call through after one ended without an outcome,
+        such as by being cancelled.
+        """
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Opening circuit for %s.", self.host)
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+
+    def __init__(
+        self, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN
+    ):
+        """
+        Every call deposits ratio of a token and every retry withdraws one, so
+        retries stay within ratio of the calls made. The balance starts at and
+        is capped to minimum, letting a quiet process retry a few times.
+        """
+        self.ratio = ratio
+        self.capacity = minimum
+        self.tokens = float(minimum)
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.capacity)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+retry_budget = RetryBudget()
+_breakers = {}
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    if host not in _breakers:
+        _breakers[host] = CircuitBreaker(host)
+    return _breakers[host]
+
+
+def is_upstream_failure(e: Exception) -> bool:
+    """
+    Whether e means the upstream is unavailable, as opposed to the request
+    being wrong. Only these failures are retried and count against circuits.
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(
+        e,
+        (
+            httpx.TransportError,
+            asyncio.TimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        ),
+    )
+
+
+async def call_upstream(host: str, fetch, deadline: float = UPSTREAM_DEADLINE):
+    """
+    Await fetch(), a coroutine function calling host, behind host's circuit
+    breaker. Upstream failures are retried with full jitter while attempts,
+    the retry budget and the deadline allow. The deadline bounds the whole
+    call, attempts and waits included, and raises asyncio.TimeoutError.
+    """
+    breaker = get_circuit_breaker(host)
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+    retry_budget.deposit()
+    attempt = 1
+    while True:
+        breaker.before_call()
+        try:
+            result = await asyncio.wait_for(fetch(), deadline_at - loop.time())
+        except Exception as e:
+            if not is_upstream_failure(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = random.uniform(
+                0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+            )
+            if (
+                attempt >= UPSTREAM_ATTEMPTS
+                or loop.time() + delay >= deadline_at
+                or not retry_budget.withdraw()
+            ):
+                raise
+            RETRIES.labels(host).inc()
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release_trial()
+            raise
+        breaker.record_success()
+        return result
@@ -0,0 +1,30 @@
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+async def _ndjson_lines(documents):
+    async for document in documents:
+        yield orjson.dumps(document, default=str) + b"\n"
+
+
+def ndjson_response(documents) -> StreamingResponse:
+    """
+    Stream documents from an async iterator, such as a Mongo cursor, as
+    newline-delimited JSON, writing each one as it arrives.
+    """
+    return StreamingResponse(
+        _ndjson_lines(documents), media_type="application/x-ndjson"
+    )
+
+
+def set_next_page_link(request: Request, response: Response, page: list, limit: int):
+    """
+    Point the Link header at the page after this one, keyed on the last _id.
+    """
+    if len(page) == limit:
+        next_url = request.url.include_query_params(after=page[-1]["_id"], limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
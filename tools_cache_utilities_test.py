@@ -0,0 +1,115 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock
+from redis.exceptions import ConnectionError
+from tools.cache_utilities import TTLCache
+
+
+class TestTTLCache(unittest.IsolatedAsyncioTestCase):
+    async def test_get_or_fetch_caches_value(self):
+        cache = TTLCache("test")
+        fetch = AsyncMock(return_value=({"periods": []}, 60))
+        await cache.get_or_fetch(("LMK", 84, 86), fetch)
+        result = await cache.get_or_fetch(("LMK", 84, 86), fetch)
+        self.assertEqual(result, {"periods": []})
+        fetch.assert_awaited_once()
+
+    async def test_expired_value_is_fetched_again(self):
+        cache = TTLCache("test")
+        await cache.set("key", "old", 60)
+        cache._entries["key"] = (time.time() - 1, "old")
+        result = await cache.get_or_fetch("key", AsyncMock(return_value=("new", 60)))
+        self.assertEqual(result, "new")
+
+    async def test_concurrent_misses_fetch_once(self):
+        cache = TTLCache("test")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value", 60
+
+        results = await asyncio.gather(
+            *[cache.get_or_fetch("key", fetch) for _ in range(10)]
+        )
+        self.assertEqual(results, ["value"] * 10)
+        self.assertEqual(len(calls), 1)
+
+    async def test_concurrent_misses_share_errors(self):
+        cache = TTLCache("test")
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(
+            *[cache.get_or_fetch("key", fetch) for _ in range(3)],
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    async def test_waiter_fetches_when_fetching_caller_is_cancelled(self):
+        cache = TTLCache("test")
+        started = asyncio.Event()
+
+        async def slow_fetch():
+            started.set()
+            await asyncio.sleep(10)
+
+        first = asyncio.create_task(cache.get_or_fetch("key", slow_fetch))
+        await started.wait()
+        second = asyncio.create_task(
+            cache.get_or_fetch("key", AsyncMock(return_value=("value", 60)))
+        )
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, "value")
+
+    async def test_redis_backing(self):
+        redis_client = AsyncMock()
+        redis_client.get.return_value = b'"shared"'
+        redis_client.ttl.return_value = 30
+        cache = TTLCache("forecast", redis_client)
+        self.assertEqual(await cache.get(("LMK", 84, 86)), "shared")
+        redis_client.get.assert_awaited_once_with("forecast:LMK:84:86")
+
+    async def test_redis_errors_fall_back_to_process_cache(self):
+        redis_client = AsyncMock()
+        redis_client.get.side_effect = ConnectionError("down")
+        redis_client.set.side_effect = ConnectionError("down")
+        cache = TTLCache("forecast", redis_client)
+        fetch = AsyncMock(return_value=("fetched", 60))
+        self.assertEqual(await cache.get_or_fetch("key", fetch), "fetched")
+        self.assertEqual(await cache.get_or_fetch("key", fetch), "fetched")
+        fetch.assert_awaited_once()
+
+    async def test_max_entries_evicts_least_recently_used(self):
+        cache = TTLCache("test", max_entries=2)
+        await cache.set("a", 1, 60)
+        await cache.set("b", 2, 60)
+        await cache.get("a")
+        await cache.set("c", 3, 60)
+        self.assertEqual(list(cache._entries), ["a", "c"])
+
+    async def test_stats_count_hits_and_misses(self):
+        redis_client = AsyncMock()
+        redis_client.get.side_effect = [None, b"2"]
+        redis_client.ttl.return_value = 30
+        cache = TTLCache("test", redis_client)
+        await cache.get("missing")
+        await cache.get("shared")
+        await cache.get("shared")
+        self.assertEqual(cache.stats, {"hits": 1, "redis_hits": 1, "misses": 1})
+
+    async def test_get_stale_returns_recently_expired_value(self):
+        cache = TTLCache("test", stale_ttl=60)
+        await cache.set("key", "old", 60)
+        cache._entries["key"] = (time.time() - 1, "old")
+        self.assertIsNone(await cache.get("key"))
+        self.assertEqual(await cache.get_stale("key"), "old")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import asyncio
+import copy
+import datetime
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+import tools.forecast_utilities as forecast_utilities
+from models import EST
+from tools.forecast_utilities import (
+    Forecast,
+    PeriodIndex,
+    _to_epoch,
+    batch_by_tokens,
+    compact_periods,
+    describe_periods,
+    fingerprint_changed,
+    fingerprint_forecast,
+)
+
+
+def hourly_periods(count):
+    return [
+        {
+            "number": hour + 1,
+            "startTime": f"2024-03-01T{hour:02d}:00:00-05:00",
+            "endTime": f"2024-03-01T{hour + 1:02d}:00:00-05:00",
+        }
+        for hour in range(count)
+    ]
+
+
+def filtered(periods):
+    return PeriodIndex(compact_periods(periods)).overlapping(0, 2**40)
+
+
+class TestPeriodIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PeriodIndex(compact_periods(list(reversed(hourly_periods(12)))))
+
+    def hours(self, periods):
+        return [
+            datetime.datetime.fromtimestamp(start, EST).hour
+            for start in periods["start"]
+        ]
+
+    def test_overlapping_returns_every_period_in_window(self):
+        periods = self.index.overlapping(
+            _to_epoch("2024-03-01T03:30:00-05:00"),
+            _to_epoch("2024-03-01T06:00:00-05:00"),
+        )
+        self.assertEqual(self.hours(periods), [3, 4, 5])
+
+    def test_overlapping_across_time_zones(self):
+        periods = self.index.overlapping(
+            _to_epoch("2024-03-01T15:00:00+00:00"),
+            _to_epoch("2024-03-01T16:30:00+00:00"),
+        )
+        self.assertEqual(self.hours(periods), [10, 11])
+
+    def test_overlapping_without_end_returns_containing_period(self):
+        periods = self.index.overlapping(_to_epoch("2024-03-01T02:00:00-05:00"))
+        self.assertEqual(self.hours(periods), [2])
+
+    def test_window_outside_forecast(self):
+        periods = self.index.overlapping(
+            _to_epoch("2024-03-02T02:00:00-05:00"),
+            _to_epoch("2024-03-02T03:00:00-05:00"),
+        )
+        self.assertEqual(periods["start"], [])
+
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.periods = [
+            {
+                "startTime": "2024-03-01T12:00:00-05:00",
+                "endTime": "2024-03-01T13:00:00-05:00",
+                "temperature": 60,
+                "probabilityOfPrecipitation": {
+                    "unitCode": "wmoUnit:percent",
+                    "value": 20,
+                },
+                "windSpeed": "5 to 10 mph",
+                "shortForecast": "Chance Showers",
+            }
+        ]
+        self.fingerprint = fingerprint_forecast(filtered(self.periods))
+
+    def test_fingerprint_fields(self):
+        self.assertEqual(
+            self.fingerprint,
+            [[_to_epoch("2024-03-01T12:00:00-05:00"), 60, 20, 10, "Chance Showers"]],
+        )
+
+    def test_compact_periods_intern_strings(self):
+        columns = compact_periods(self.periods * 2)
+        self.assertEqual(columns["strings"], ["", "Chance Showers"])
+        self.assertEqual(columns["shortForecast"], [1, 1])
+
+    def test_describe_periods(self):
+        self.assertEqual(
+            describe_periods(filtered(self.periods)),
+            "Fri Mar 01 12:00 PM -0500: 60°F, 20% precipitation, wind 10 mph, "
+            "Chance Showers",
+        )
+
+    def test_small_changes_are_not_material(self):
+        self.periods[0]["temperature"] = 62
+        self.periods[0]["probabilityOfPrecipitation"]["value"] = 25
+        self.periods[0]["windSpeed"] = "5 to 12 mph"
+        current = fingerprint_forecast(filtered(self.periods))
+        self.assertFalse(fingerprint_changed(self.fingerprint, current))
+
+    def test_threshold_changes_are_material(self):
+        self.periods[0]["probabilityOfPrecipitation"]["value"] = 30
+        current = fingerprint_forecast(filtered(self.periods))
+        self.assertTrue(fingerprint_changed(self.fingerprint, current))
+
+    def test_short_forecast_change_is_material(self):
+        self.periods[0]["shortForecast"] = "Thunderstorms"
+        current = fingerprint_forecast(filtered(self.periods))
+        self.assertTrue(fingerprint_changed(self.fingerprint, current))
+
+
+class TestSummarizeForecasts(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        forecast_utilities.summary_cache._entries.clear()
+        self.forecasts = []
+        for hour in range(3):
+            forecast = Forecast(
+                {
+                    "event_id": f"event-{hour}",
+                    "time": {"startDateTime": f"2024-03-01T{hour:02d}:00:00-05:00"},
+                    "place": {"gridId": "LMK", "gridX": 84, "gridY": 86},
+                }
+            )
+            forecast.forecast = {
+                "raw_filtered": filtered(hourly_periods(12)[hour : hour + 1])
+            }
+            forecast.expires_at = time.time() + 60
+            self.forecasts.append(forecast)
+
+    def test_batch_by_tokens(self):
+        self.assertEqual(
+            batch_by_tokens(list("abcde"), [1, 1, 5, 1, 1], 3, 5),
+            [["a", "b"], ["c"], ["d", "e"]],
+        )
+
+    async def test_one_completion_per_batch(self):
+        summaries = {
+            f"event-{hour}": {"content": f"summary {hour}"} for hour in range(3)
+        }
+        with patch.object(
+            forecast_utilities, "create_summaries", AsyncMock(return_value=summaries)
+        ) as create_summaries:
+            await forecast_utilities.summarize_forecasts(self.forecasts)
+        create_summaries.assert_awaited_once()
+        self.assertEqual(
+            self.forecasts[2].forecast["chatgpt_summary"], {"content": "summary 2"}
+        )
+
+    async def test_concurrent_requests_share_completions(self):
+        summaries = {
+            f"event-{hour}": {"content": f"summary {hour}"} for hour in range(3)
+        }
+
+        async def create_summaries(requests):
+            await asyncio.sleep(0.01)
+            return summaries
+
+        others = copy.deepcopy(self.forecasts)
+        with patch.object(
+            forecast_utilities, "create_summaries", AsyncMock(wraps=create_summaries)
+        ) as mock:
+            await asyncio.gather(
+                forecast_utilities.summarize_forecasts(self.forecasts),
+                forecast_utilities.summarize_forecasts(others),
+            )
+        mock.assert_awaited_once()
+        self.assertEqual(
+            others[1].forecast["chatgpt_summary"], {"content": "summary 1"}
+        )
+        self.assertEqual(forecast_utilities.summary_cache._inflight, {})
+
+    async def test_unparsable_reply_falls_back_to_one_completion_each(self):
+        with patch.object(
+            forecast_utilities,
+            "create_summaries",
+            AsyncMock(side_effect=ValueError("no tool call")),
+        ), patch.object(
+            Forecast, "create_summary", AsyncMock(return_value={"content": "one"})
+        ) as create_summary:
+            await forecast_utilities.summarize_forecasts(self.forecasts)
+        self.assertEqual(create_summary.await_count, 3)
+        self.assertEqual(
+            self.forecasts[0].forecast["chatgpt_summary"], {"content": "one"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from tools.geocode_utilities import GeocodeIndex, GeocodeProvider, GeocodeRouter
+from tools.place_utilities import normalize_address
+
+VENUES = [
+    (normalize_address("1001 S 3rd St, Louisville, KY 40203"), 38.24, -85.76),
+    (normalize_address("700 W Main St, Louisville, KY 40202"), 38.26, -85.76),
+    (normalize_address("700 W Market St, Louisville, KY 40202"), 38.25, -85.76),
+]
+ZIPS = {"40202": (38.25, -85.75)}
+
+
+class TestGeocodeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GeocodeIndex(VENUES, ZIPS)
+
+    def lookup(self, address):
+        return self.index.lookup(normalize_address(address))
+
+    def test_exact(self):
+        self.assertEqual(
+            self.lookup("700 West Main Street, Louisville, KY 40202"), (38.26, -85.76)
+        )
+
+    def test_prefix_and_extension(self):
+        self.assertEqual(self.lookup("1001 S 3rd St, Louisville"), (38.24, -85.76))
+        self.assertEqual(
+            self.lookup("1001 S 3rd St, Louisville, KY 40203, USA"), (38.24, -85.76)
+        )
+        # A partial word is not a prefix of any venue.
+        self.assertIsNone(self.lookup("700 W Ma"))
+        # Ambiguous between Main and Market.
+        self.assertIsNone(self.lookup("700 W"))
+
+    def test_extension_must_not_add_a_location(self):
+        index = GeocodeIndex([("123 main st", 38.26, -85.76)])
+        self.assertEqual(index.lookup("123 main st usa"), (38.26, -85.76))
+        self.assertIsNone(index.lookup("123 main st springfield il 62701"))
+
+    def test_misspelling(self):
+        self.assertEqual(
+            self.lookup("700 W Mian St, Louisville, KY 40202"), (38.26, -85.76)
+        )
+        self.assertIsNone(self.lookup("702 W Main St, Louisville, KY 40202"))
+        self.assertIsNone(self.lookup("700 E Main St, Louisville, KY 40202"))
+        self.assertIsNone(self.lookup("700 W Main St, Louisville, KY 40207"))
+        self.assertIsNone(self.lookup("700 W Main Ave, Louisville, KY 40202"))
+        self.assertIsNone(self.lookup("700 W Maple St, Louisville, KY 40202"))
+
+    def test_zip_centroid_only_without_house_number(self):
+        self.assertEqual(
+            self.lookup("Waterfront Park, Louisville, KY 40202"), ZIPS["40202"]
+        )
+        self.assertIsNone(self.lookup("123 E Main St, Louisville, KY 40202"))
+
+
+def provider(name, location, delay=0, error=None, quota=None):
+    async def fetch(address):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return location
+
+    geocoder = GeocodeProvider(name, f"{name}.test", fetch, quota)
+    geocoder.latencies.extend([0.01] * 20)
+    return geocoder
+
+
+class TestGeocodeRouter(unittest.IsolatedAsyncioTestCase):
+    async def test_hedges_slow_provider(self):
+        here = provider("here", (1, 1), delay=1)
+        google = provider("google", (2, 2))
+        router = GeocodeRouter([here, google])
+        self.assertEqual(await router.geocode("123 main st"), (2, 2))
+        self.assertEqual((here.calls_today, google.calls_today), (1, 1))
+
+    async def test_no_hedge_when_fast(self):
+        here = provider("here", (1, 1))
+        google = provider("google", (2, 2))
+        router = GeocodeRouter([here, google])
+        self.assertEqual(await router.geocode("123 main st"), (1, 1))
+        self.assertEqual(google.calls_today, 0)
+
+    async def test_falls_back_on_failure_and_quota(self):
+        here = provider("here", None, error=ValueError("No results."))
+        google = provider("google", (2, 2))
+        router = GeocodeRouter([here, google])
+        self.assertEqual(await router.geocode("123 main st"), (2, 2))
+
+        here = provider("here", (1, 1), quota=1)
+        router = GeocodeRouter([here, google])
+        await router.geocode("123 main st")
+        self.assertEqual(await router.geocode("123 main st"), (2, 2))
+        self.assertEqual(here.calls_today, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
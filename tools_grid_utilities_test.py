@@ -0,0 +1,63 @@
+import math
+import os
+import tempfile
+import unittest
+from tools.grid_utilities import GridIndex, ndfd_position
+
+
+def lmk(lat, lon):
+    """
+    A stand-in for api.weather.gov with the LMK grid a fixed window of the
+    NDFD grid.
+    """
+    column, row = ndfd_position(lat, lon)
+    return "LMK", math.floor(column - 1364.3), math.floor(row - 622.6)
+
+
+def points(lat, lon, n=5, step=0.013):
+    return [
+        (round(lat + i * step, 4), round(lon + j * step, 4))
+        for i in range(n)
+        for j in range(n)
+    ]
+
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GridIndex()
+        for lat, lon in points(38.10, -85.90, n=12, step=0.025):
+            self.assertTrue(self.index.add(lat, lon, *lmk(lat, lon)))
+
+    def test_lookup_matches_api(self):
+        resolved = 0
+        for lat, lon in points(38.2052, -85.7951, step=0.0071):
+            gridpoints = self.index.lookup(lat, lon)
+            if gridpoints is not None:
+                self.assertEqual(gridpoints, lmk(lat, lon))
+                resolved += 1
+        self.assertGreater(resolved, 0)
+
+    def test_unknown_area_and_office_boundary(self):
+        self.assertIsNone(self.index.lookup(39.7456, -97.0892))
+        # Seen, but next to tiles that have not been.
+        self.assertIsNone(self.index.lookup(38.1052, -85.7951))
+        self.index.add(38.2301, -85.7002, "JKL", 10, 10)
+        self.assertIsNone(self.index.lookup(38.2203, -85.7601))
+
+    def test_disagreement_disables_office(self):
+        lat, lon = 38.2252, -85.7753
+        gridId, gridX, gridY = lmk(lat, lon)
+        self.assertFalse(self.index.add(lat, lon, gridId, gridX + 3, gridY))
+        self.assertIsNone(self.index.lookup(lat, lon))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grid_index.json")
+            self.index.save(path)
+            loaded = GridIndex.load(path)
+        for lat, lon in points(38.2052, -85.7951, step=0.0071):
+            self.assertEqual(loaded.lookup(lat, lon), self.index.lookup(lat, lon))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from prometheus_client import REGISTRY
+from tools.metrics_utilities import new_trace_id, timed
+
+
+class TestTimed(unittest.IsolatedAsyncioTestCase):
+    async def test_observes_latency_and_errors(self):
+        @timed("test_stage")
+        async def stage(fail=False):
+            if fail:
+                raise ValueError("upstream failed")
+            return "ok"
+
+        self.assertEqual(await stage(), "ok")
+        with self.assertRaises(ValueError):
+            await stage(fail=True)
+        self.assertEqual(
+            REGISTRY.get_sample_value(
+                "raincheck_stage_seconds_count", {"stage": "test_stage"}
+            ),
+            2,
+        )
+        self.assertEqual(
+            REGISTRY.get_sample_value(
+                "raincheck_stage_errors_total",
+                {"stage": "test_stage", "error": "ValueError"},
+            ),
+            1,
+        )
+
+
+class TestNewTraceId(unittest.TestCase):
+    def test_keeps_valid_and_replaces_invalid_ids(self):
+        self.assertEqual(new_trace_id("abc-123"), "abc-123")
+        for trace_id in ["x" * 200, "a b", "", None]:
+            replaced = new_trace_id(trace_id)
+            self.assertNotEqual(replaced, trace_id)
+            self.assertEqual(len(replaced), 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+from tools.place_utilities import normalize_address
+
+
+class TestNormalizeAddress(unittest.TestCase):
+    def test_abbreviations_and_case(self):
+        self.assertEqual(
+            normalize_address("123 Main Street, Louisville, KY 40202"),
+            normalize_address("123 main st louisville ky 40202"),
+        )
+
+    def test_directions_and_punctuation(self):
+        self.assertEqual(
+            normalize_address("500 W. Jefferson  Avenue, Suite #2"),
+            "500 w jefferson ave ste #2",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+import httpx
+from tools.resilience_utilities import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    call_upstream,
+    get_circuit_breaker,
+)
+
+
+def status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://api.weather.gov/points/1,1")
+    return httpx.HTTPStatusError(
+        "error", request=request, response=httpx.Response(status_code)
+    )
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_lets_one_trial_through(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "half-open")
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_withdrawals_are_limited_by_deposits(self):
+        budget = RetryBudget(ratio=0.5, minimum=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+
+class TestCallUpstream(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_server_errors(self):
+        fetch = AsyncMock(side_effect=[status_error(503), "ok"])
+        self.assertEqual(await call_upstream("retry.test", fetch), "ok")
+        self.assertEqual(fetch.await_count, 2)
+
+    async def test_does_not_retry_client_errors(self):
+        fetch = AsyncMock(side_effect=status_error(404))
+        with self.assertRaises(httpx.HTTPStatusError):
+            await call_upstream("client-error.test", fetch)
+        fetch.assert_awaited_once()
+
+    async def test_cancelled_trial_releases_circuit(self):
+        breaker = get_circuit_breaker("cancelled.test")
+        breaker.reset_timeout = 0
+        breaker.opened_at = 0
+
+        async def fetch():
+            await asyncio.sleep(1)
+
+        task = asyncio.create_task(call_upstream("cancelled.test", fetch))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(
+            await call_upstream("cancelled.test", AsyncMock(return_value="ok")), "ok"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()